@@ -22,6 +22,7 @@ import tensorflow as tf
 import tensorflow_model_optimization as tfmot
 from official.projects.qat.vision.n_bit import configs
 from official.projects.qat.vision.n_bit import nn_blocks
+from official.projects.qat.vision.quantization import helper
 
 keras = tf.keras
 default_n_bit_transforms = tfmot.quantization.keras.experimental.default_n_bit.default_n_bit_transforms
@@ -73,7 +74,8 @@ class CustomLayerQuantize(
   def replacement(self, match_layer: _LayerNode) -> _LayerNode:
     """See base class."""
     bottleneck_layer = match_layer.layer
-    bottleneck_config = bottleneck_layer['config']
+    bottleneck_config = helper.remove_float_only_config_keys(
+        bottleneck_layer['config'])
     bottleneck_config['num_bits_weight'] = self._num_bits_weight
     bottleneck_config['num_bits_activation'] = self._num_bits_activation
     bottleneck_names_and_weights = list(match_layer.names_and_weights)
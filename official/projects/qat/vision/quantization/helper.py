@@ -38,6 +38,10 @@ _ORIGINAL_WEIGHT_NAME = [
     'moving_variance', 'bias'
 ]
 
+# Config keys of the float blocks that only affect how the float graph is
+# executed and are not accepted by the quantized blocks.
+_FLOAT_ONLY_CONFIG_KEYS = ('fuse_squeeze_excitation', 'jit_compile')
+
 
 def is_quantization_weight_name(name: str) -> bool:
   simple_name = name.split('/')[-1].split(':')[0]
@@ -48,6 +52,11 @@ def is_quantization_weight_name(name: str) -> bool:
   raise ValueError('Variable name {} is not supported.'.format(simple_name))
 
 
+def remove_float_only_config_keys(config: Dict[str, Any]) -> Dict[str, Any]:
+  """Returns a copy of a float block config the quantized block accepts."""
+  return {k: v for k, v in config.items() if k not in _FLOAT_ONLY_CONFIG_KEYS}
+
+
 def copy_original_weights(original_model: tf.keras.Model,
                           quantized_model: tf.keras.Model):
   """Helper function that copy the original model weights to quantized model."""
@@ -71,7 +71,8 @@ class CustomLayerQuantize(
   def replacement(self, match_layer: LayerNode) -> LayerNode:
     """See base class."""
     bottleneck_layer = match_layer.layer
-    bottleneck_config = bottleneck_layer['config']
+    bottleneck_config = helper.remove_float_only_config_keys(
+        bottleneck_layer['config'])
     bottleneck_names_and_weights = list(match_layer.names_and_weights)
     quantized_layer = self._quantized_layer_class(**bottleneck_config)
     dummy_input_shape = self._create_dummy_input_shape(quantized_layer)
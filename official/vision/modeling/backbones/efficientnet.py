@@ -153,10 +153,8 @@ class EfficientNet(tf.keras.Model):
     self._bias_regularizer = bias_regularizer
     self._norm = layers.BatchNormalization
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      bn_axis = -1
-    else:
-      bn_axis = 1
+    nn_blocks.check_channels_last(self)
+    bn_axis = -1
 
     # Build EfficientNet.
     inputs = tf.keras.Input(shape=input_specs.shape[1:])
@@ -98,6 +98,14 @@ class EfficientNetTest(parameterized.TestCase, tf.test.TestCase):
     # If the serialization was successful, the new config should match the old.
     self.assertAllEqual(network.get_config(), new_network.get_config())
 
+  def test_channels_first_unsupported(self):
+    tf.keras.backend.set_image_data_format('channels_first')
+    self.addCleanup(tf.keras.backend.set_image_data_format, 'channels_last')
+    input_specs = tf.keras.layers.InputSpec(shape=[None, 3, None, None])
+
+    with self.assertRaisesRegex(ValueError, 'channels_last'):
+      efficientnet.EfficientNet(model_id='b0', input_specs=input_specs)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -413,6 +413,8 @@ class MobileDet(tf.keras.Model):
     self._norm_momentum = norm_momentum
     self._norm_epsilon = norm_epsilon
 
+    nn_blocks.check_channels_last(self)
+
     inputs = tf.keras.Input(shape=input_specs.shape[1:])
 
     block_specs = SUPPORTED_SPECS_MAP.get(model_id)
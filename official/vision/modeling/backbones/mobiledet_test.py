@@ -112,3 +112,11 @@ class MobileDetTest(parameterized.TestCase, tf.test.TestCase):
       self.assertAllEqual(
           [1, input_size / 2 ** (idx+1), input_size / 2 ** (idx+1), num_filter],
           endpoints[str(idx+1)].shape.as_list())
+
+  def test_channels_first_unsupported(self):
+    tf.keras.backend.set_image_data_format('channels_first')
+    self.addCleanup(tf.keras.backend.set_image_data_format, 'channels_last')
+    input_specs = tf.keras.layers.InputSpec(shape=[None, 3, None, None])
+
+    with self.assertRaisesRegex(ValueError, 'channels_last'):
+      mobiledet.MobileDet(model_id='MobileDetCPU', input_specs=input_specs)
@@ -714,6 +714,8 @@ class MobileNet(tf.keras.Model):
     self._finegrain_classification_mode = finegrain_classification_mode
     self._output_intermediate_endpoints = output_intermediate_endpoints
 
+    nn_blocks.check_channels_last(self)
+
     inputs = tf.keras.Input(shape=input_specs.shape[1:])
 
     block_specs = SUPPORTED_SPECS_MAP.get(model_id)
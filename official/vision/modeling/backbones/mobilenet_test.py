@@ -293,6 +293,14 @@ class MobileNetTest(parameterized.TestCase, tf.test.TestCase):
         [1, input_size / output_stride, input_size / output_stride, num_filter],
         endpoints[str(level)].shape.as_list())
 
+  def test_channels_first_unsupported(self):
+    tf.keras.backend.set_image_data_format('channels_first')
+    self.addCleanup(tf.keras.backend.set_image_data_format, 'channels_last')
+    input_specs = tf.keras.layers.InputSpec(shape=[None, 3, None, None])
+
+    with self.assertRaisesRegex(ValueError, 'channels_last'):
+      mobilenet.MobileNet(model_id='MobileNetV2', input_specs=input_specs)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -185,10 +185,8 @@ class ResNet(tf.keras.Model):
     self._bias_regularizer = bias_regularizer
     self._bn_trainable = bn_trainable
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._bn_axis = -1
-    else:
-      self._bn_axis = 1
+    nn_blocks.check_channels_last(self)
+    self._bn_axis = -1
 
     # Build ResNet.
     inputs = tf.keras.Input(shape=input_specs.shape[1:])
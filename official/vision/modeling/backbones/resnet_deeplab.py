@@ -136,10 +136,8 @@ class DilatedResNet(tf.keras.Model):
     self._se_ratio = se_ratio
     self._init_stochastic_depth_rate = init_stochastic_depth_rate
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      bn_axis = -1
-    else:
-      bn_axis = 1
+    nn_blocks.check_channels_last(self)
+    bn_axis = -1
 
     # Build ResNet.
     inputs = tf.keras.Input(shape=input_specs.shape[1:])
@@ -119,6 +119,14 @@ class ResNetTest(parameterized.TestCase, tf.test.TestCase):
     inputs = tf.keras.Input(shape=(128, 128, input_dim), batch_size=1)
     _ = network(inputs)
 
+  def test_channels_first_unsupported(self):
+    tf.keras.backend.set_image_data_format('channels_first')
+    self.addCleanup(tf.keras.backend.set_image_data_format, 'channels_last')
+    input_specs = tf.keras.layers.InputSpec(shape=[None, 3, None, None])
+
+    with self.assertRaisesRegex(ValueError, 'channels_last'):
+      resnet.ResNet(model_id=50, input_specs=input_specs)
+
   def test_serialize_deserialize(self):
     # Create a network object that sets all of its config options.
     kwargs = dict(
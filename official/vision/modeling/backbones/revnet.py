@@ -95,7 +95,7 @@ class RevNet(tf.keras.Model):
     self._kernel_regularizer = kernel_regularizer
     self._norm = tf.keras.layers.BatchNormalization
 
-    axis = -1 if tf.keras.backend.image_data_format() == 'channels_last' else 1
+    nn_blocks.check_channels_last(self)
 
     # Build RevNet.
     inputs = tf.keras.Input(shape=input_specs.shape[1:])
@@ -106,7 +106,7 @@ class RevNet(tf.keras.Model):
         kernel_initializer=self._kernel_initializer,
         kernel_regularizer=self._kernel_regularizer)(inputs)
     x = self._norm(
-        axis=axis,
+        axis=-1,
         momentum=norm_momentum,
         epsilon=norm_epsilon,
         synchronized=use_sync_bn)(x)
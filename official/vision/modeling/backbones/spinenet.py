@@ -207,10 +207,8 @@ class SpineNet(tf.keras.Model):
     self._set_activation_fn(activation)
     self._norm = layers.BatchNormalization
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._bn_axis = -1
-    else:
-      self._bn_axis = 1
+    nn_blocks.check_channels_last(self)
+    self._bn_axis = -1
 
     # Build SpineNet.
     inputs = tf.keras.Input(shape=input_specs.shape[1:])
@@ -134,6 +134,14 @@ class SpineNetTest(parameterized.TestCase, tf.test.TestCase):
     with self.assertRaises(ValueError):
       spinenet.SpineNet(activation='invalid_activation_name')
 
+  def test_channels_first_unsupported(self):
+    tf.keras.backend.set_image_data_format('channels_first')
+    self.addCleanup(tf.keras.backend.set_image_data_format, 'channels_last')
+    input_specs = tf.keras.layers.InputSpec(shape=[None, 3, None, None])
+
+    with self.assertRaisesRegex(ValueError, 'channels_last'):
+      spinenet.SpineNet(input_specs=input_specs)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -167,17 +167,13 @@ class ClassificationNetworkTest(parameterized.TestCase, tf.test.TestCase):
           strategy=[
               strategy_combinations.one_device_strategy_gpu,
           ],
-          data_format=['channels_last', 'channels_first'],
           input_dim=[1, 3, 4]))
-  def test_data_format_gpu(self, strategy, data_format, input_dim):
-    """Test for different data formats on GPU devices."""
-    if data_format == 'channels_last':
-      inputs = np.random.rand(2, 128, 128, input_dim)
-    else:
-      inputs = np.random.rand(2, input_dim, 128, 128)
+  def test_data_format_gpu(self, strategy, input_dim):
+    """Test for the channels_last data format on GPU devices."""
+    inputs = np.random.rand(2, 128, 128, input_dim)
     input_specs = tf.keras.layers.InputSpec(shape=inputs.shape)
 
-    tf.keras.backend.set_image_data_format(data_format)
+    tf.keras.backend.set_image_data_format('channels_last')
 
     with strategy.scope():
       backbone = backbones.ResNet(model_id=50, input_specs=input_specs)
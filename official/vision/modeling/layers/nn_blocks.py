@@ -14,6 +14,7 @@
 
 """Contains common building blocks for neural networks."""
 
+import functools
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union, Text
 
 # Import libraries
@@ -25,32 +26,194 @@ from official.nlp import modeling as nlp_modeling
 from official.vision.modeling.layers import nn_layers
 
 
-def _pad_strides(strides: int, axis: int) -> Tuple[int, int, int, int]:
-  """Converts int to len 4 strides (`tf.nn.avg_pool` uses length 4)."""
-  if axis == 1:
-    return (1, 1, strides, strides)
-  else:
-    return (1, strides, strides, 1)
+def _maybe_downsample(x: tf.Tensor, out_filter: int,
+                      strides: int) -> tf.Tensor:
+  """Downsamples NHWC feature map and 0-pads it if in_filter != out_filter."""
+  if strides > 1:
+    x = tf.nn.avg_pool(x, strides, strides, 'VALID')
 
+  in_filter = x.shape[-1]
+  if in_filter < out_filter:
+    # Pad on channel dimension with 0s: half on top half on bottom.
+    paddings = [[0, 0]] * 3 + [[(out_filter - in_filter) // 2] * 2]
+    x = tf.pad(x, paddings)
 
-def _maybe_downsample(x: tf.Tensor, out_filter: int, strides: int,
-                      axis: int) -> tf.Tensor:
-  """Downsamples feature map and 0-pads tensor if in_filter != out_filter."""
-  data_format = 'NCHW' if axis == 1 else 'NHWC'
-  strides = _pad_strides(strides, axis=axis)
+  return x
 
-  x = tf.nn.avg_pool(x, strides, strides, 'VALID', data_format=data_format)
 
-  in_filter = x.shape[axis]
-  if in_filter < out_filter:
-    # Pad on channel dimension with 0s: half on top half on bottom.
-    pad_size = [(out_filter - in_filter) // 2, (out_filter - in_filter) // 2]
-    if axis == 1:
-      x = tf.pad(x, [[0, 0], pad_size, [0, 0], [0, 0]])
+def check_channels_last(layer: tf.keras.layers.Layer):
+  """Raises if the global image data format is not `channels_last`.
+
+  The conv blocks in this module, except TuckerConvBlock, only support NHWC so
+  that convolutions and batch norms run on their native channels-last kernels
+  without layout transposes. The backbones built from them only support NHWC as
+  well. On CPU, oneDNN reorders NHWC activations and weights into its
+  SIMD-blocked layouts (e.g. nChw8c/nChw16c) internally; there is no Keras-level
+  hint to request them.
+
+  Args:
+    layer: The `tf.keras.layers.Layer` or backbone `tf.keras.Model` being
+      built.
+
+  Raises:
+    ValueError: If `tf.keras.backend.image_data_format()` is not
+      `channels_last`.
+  """
+  if tf.keras.backend.image_data_format() != 'channels_last':
+    raise ValueError(
+        '{} only supports the `channels_last` image data format, got '
+        '`{}`.'.format(layer.__class__.__name__,
+                       tf.keras.backend.image_data_format()))
+
+
+def _get_batch_norm(use_sync_bn: bool) -> Callable[
+    ..., tf.keras.layers.BatchNormalization]:
+  """Returns the batch norm constructor for the NHWC conv blocks.
+
+  Non-synchronized batch norm is pinned to the fused kernel so that an
+  unsupported configuration raises instead of silently falling back to the
+  slower composite implementation. Synchronized batch norm aggregates moments
+  across replicas and has no fused kernel.
+
+  Args:
+    use_sync_bn: A `bool`. If True, use synchronized batch normalization.
+
+  Returns:
+    A callable that creates a `tf.keras.layers.BatchNormalization` layer.
+  """
+  if use_sync_bn:
+    return tf.keras.layers.BatchNormalization
+  return functools.partial(tf.keras.layers.BatchNormalization, fused=True)
+
+
+def _fuse_conv_and_norm(
+    conv: Union[tf.keras.layers.Conv2D, tf.keras.layers.DepthwiseConv2D],
+    norm: tf.keras.layers.BatchNormalization,
+    activation: Optional[Callable[..., tf.Tensor]] = None,
+) -> Union[tf.keras.layers.Conv2D, tf.keras.layers.DepthwiseConv2D]:
+  """Folds a batch norm and an optional activation into a convolution.
+
+  With frozen statistics, `norm(conv(x))` equals a convolution with kernel
+  `w * gamma / sqrt(var + eps)` and bias `beta + (b - mean) * gamma /
+  sqrt(var + eps)`, so a single conv + bias + activation op replaces the three
+  separate ops at inference.
+
+  Args:
+    conv: A built `tf.keras.layers.Conv2D` or `tf.keras.layers.DepthwiseConv2D`.
+    norm: A built `tf.keras.layers.BatchNormalization` applied to the output of
+      `conv`.
+    activation: An optional callable applied after the batch norm.
+
+  Returns:
+    A new built convolution layer of the same class as `conv`.
+  """
+  depthwise = isinstance(conv, tf.keras.layers.DepthwiseConv2D)
+  kernel = conv.depthwise_kernel if depthwise else conv.kernel
+  out_channels = norm.moving_mean.shape[-1]
+
+  scale = tf.math.rsqrt(norm.moving_variance + norm.epsilon)
+  if norm.scale:
+    scale *= norm.gamma
+  shift = norm.beta if norm.center else tf.zeros([out_channels])
+  bias = conv.bias if conv.use_bias else tf.zeros([out_channels])
+
+  if depthwise:
+    fused_kernel = kernel * tf.reshape(scale, [1, 1, -1, 1])
+  else:
+    fused_kernel = kernel * scale
+  fused_bias = shift + (bias - norm.moving_mean) * scale
+
+  config = conv.get_config()
+  config.update({'use_bias': True, 'activation': activation})
+  fused_conv = conv.__class__.from_config(config)
+  with tf.name_scope(fused_conv.name):
+    if conv.data_format == 'channels_first':
+      fused_conv.build(tf.TensorShape([None, kernel.shape[2], None, None]))
     else:
-      x = tf.pad(x, [[0, 0], [0, 0], [0, 0], pad_size])
+      fused_conv.build(tf.TensorShape([None, None, None, kernel.shape[2]]))
+  if depthwise:
+    fused_conv.depthwise_kernel.assign(fused_kernel)
+  else:
+    fused_conv.kernel.assign(fused_kernel)
+  fused_conv.bias.assign(fused_bias)
+  return fused_conv
+
+
+def _merge_pointwise_conv(
+    conv: tf.keras.layers.Conv2D,
+    pointwise_conv: tf.keras.layers.Conv2D) -> tf.keras.layers.Conv2D:
+  """Merges a 1x1 conv into a kxk conv over the same input as extra outputs.
+
+  The 1x1 kernel is zero-padded to kxk and concatenated to the kxk kernel along
+  the output channels, so a single convolution computes both branches. Both
+  convolutions must use biases, no activation and strides and paddings that
+  sample the kxk window centers at the 1x1 positions.
+
+  Args:
+    conv: A built `tf.keras.layers.Conv2D` with an odd kernel size.
+    pointwise_conv: A built 1x1 `tf.keras.layers.Conv2D`.
+
+  Returns:
+    A new built `tf.keras.layers.Conv2D` whose outputs are the outputs of
+    `conv` followed by the outputs of `pointwise_conv`.
+  """
+  pad = conv.kernel.shape[0] // 2
+  pointwise_kernel = tf.pad(pointwise_conv.kernel,
+                            [[pad, pad], [pad, pad], [0, 0], [0, 0]])
+  kernel = tf.concat([conv.kernel, pointwise_kernel], axis=-1)
+  bias = tf.concat([conv.bias, pointwise_conv.bias], axis=0)
+
+  config = conv.get_config()
+  config.update({'filters': kernel.shape[-1], 'activation': None})
+  merged_conv = tf.keras.layers.Conv2D.from_config(config)
+  merged_conv.build(tf.TensorShape([None, None, None, kernel.shape[2]]))
+  merged_conv.kernel.assign(kernel)
+  merged_conv.bias.assign(bias)
+  return merged_conv
+
+
+@tf.function(jit_compile=True)
+def _fused_add_and_layer_norm(x: tf.Tensor, residual: tf.Tensor,
+                              gamma: tf.Tensor, beta: tf.Tensor,
+                              epsilon: float) -> tf.Tensor:
+  """Computes a last-axis layer norm of `x + residual` in float32 with XLA."""
+  x = tf.cast(x, tf.float32) + tf.cast(residual, tf.float32)
+  mean, variance = tf.nn.moments(x, axes=[-1], keepdims=True)
+  return tf.nn.batch_normalization(x, mean, variance, beta, gamma, epsilon)
+
+
+def _add_and_layer_norm(
+    x: tf.Tensor, residual: tf.Tensor,
+    layer_norm: tf.keras.layers.LayerNormalization) -> tf.Tensor:
+  """Applies `layer_norm(x + residual)` as a single XLA-compiled kernel.
+
+  The float32 upcast, residual add, moments and normalization are fused so the
+  activations are read once instead of once per op.
+
+  Args:
+    x: A `tf.Tensor`.
+    residual: A `tf.Tensor` of the same shape as `x`.
+    layer_norm: A built float32 `tf.keras.layers.LayerNormalization` over the
+      last axis with `center` and `scale` enabled.
+
+  Returns:
+    The float32 normalized sum.
+  """
+  return _fused_add_and_layer_norm(x, residual, layer_norm.gamma,
+                                   layer_norm.beta, layer_norm.epsilon)
 
-  return x + 0.
+
+def _resolve_training(training: Optional[bool]) -> Any:
+  """Resolves `training=None` to the learning phase like `StochasticDepth`."""
+  if training is None:
+    return tf.keras.backend.learning_phase()
+  return training
+
+
+def _maybe_apply(layer: Optional[Callable[..., tf.Tensor]], x: tf.Tensor,
+                 **kwargs) -> tf.Tensor:
+  """Applies `layer` to `x`, or returns `x` unchanged if `layer` is None."""
+  return x if layer is None else layer(x, **kwargs)
 
 
 @tf.keras.utils.register_keras_serializable(package='Vision')
@@ -73,6 +236,8 @@ class ResidualBlock(tf.keras.layers.Layer):
                norm_momentum=0.99,
                norm_epsilon=0.001,
                bn_trainable=True,
+               jit_compile=False,
+               preact=False,
                **kwargs):
     """Initializes a residual block with BN after convolutions.
 
@@ -105,6 +270,14 @@ class ResidualBlock(tf.keras.layers.Layer):
       norm_epsilon: A `float` added to variance to avoid dividing by zero.
       bn_trainable: A `bool` that indicates whether batch norm layers should be
         trainable. Default to True.
+      jit_compile: A `bool`. If True, compile the block's forward pass with XLA
+        so that its convolutions, batch norms and activations are fused into
+        a few kernels. Ignored when stochastic depth is enabled.
+      preact: A `bool`. If True, use the pre-activation (ResNet v2) ordering
+        BN -> activation -> conv, with the projection shortcut applied to the
+        pre-activated input and no activation after the residual add. This
+        changes the topology, so it is not checkpoint compatible with the
+        default post-activation block.
       **kwargs: Additional keyword arguments to be passed.
     """
     super(ResidualBlock, self).__init__(**kwargs)
@@ -123,16 +296,19 @@ class ResidualBlock(tf.keras.layers.Layer):
     self._norm_epsilon = norm_epsilon
     self._kernel_regularizer = kernel_regularizer
     self._bias_regularizer = bias_regularizer
-    self._norm = tf.keras.layers.BatchNormalization
+    self._norm = _get_batch_norm(use_sync_bn)
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._bn_axis = -1
-    else:
-      self._bn_axis = 1
+    self._bn_axis = -1
     self._activation_fn = tf_utils.get_activation(activation)
     self._bn_trainable = bn_trainable
+    self._jit_compile = jit_compile
+    self._preact = preact
+    self._inference_fused = False
+    self._shortcut_merged = False
 
   def build(self, input_shape):
+    check_channels_last(self)
+
     if self._use_projection:
       self._shortcut = tf.keras.layers.Conv2D(
           filters=self._filters,
@@ -143,29 +319,31 @@ class ResidualBlock(tf.keras.layers.Layer):
               self._kernel_initializer),
           kernel_regularizer=self._kernel_regularizer,
           bias_regularizer=self._bias_regularizer)
-      self._norm0 = self._norm(
-          axis=self._bn_axis,
-          momentum=self._norm_momentum,
-          epsilon=self._norm_epsilon,
-          trainable=self._bn_trainable,
-          synchronized=self._use_sync_bn,
-      )
-
-    conv1_padding = 'same'
-    # explicit padding here is added for centernet
-    if self._use_explicit_padding:
-      self._pad = tf.keras.layers.ZeroPadding2D(padding=(1, 1))
-      conv1_padding = 'valid'
+      if not self._preact:
+        self._norm0 = self._norm(
+            axis=self._bn_axis,
+            momentum=self._norm_momentum,
+            epsilon=self._norm_epsilon,
+            trainable=self._bn_trainable,
+            synchronized=self._use_sync_bn,
+        )
 
     self._conv1 = tf.keras.layers.Conv2D(
         filters=self._filters,
         kernel_size=3,
         strides=self._strides,
-        padding=conv1_padding,
+        padding='same',
         use_bias=False,
         kernel_initializer=tf_utils.clone_initializer(self._kernel_initializer),
         kernel_regularizer=self._kernel_regularizer,
         bias_regularizer=self._bias_regularizer)
+    # explicit padding here is added for centernet. The padding is passed to
+    # the convolution op directly, so the kernel must exist before `call`.
+    # Building under the layer's name scope keeps the `conv2d/kernel` names
+    # that `__call__` would have produced.
+    if self._use_explicit_padding:
+      with tf.name_scope(self._conv1.name):
+        self._conv1.build(input_shape)
     self._norm1 = self._norm(
         axis=self._bn_axis,
         momentum=self._norm_momentum,
@@ -209,6 +387,11 @@ class ResidualBlock(tf.keras.layers.Layer):
     else:
       self._stochastic_depth = None
 
+    if self._jit_compile and not self._stochastic_depth:
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+    else:
+      self._jit_call = None
+
     super(ResidualBlock, self).build(input_shape)
 
   def get_config(self):
@@ -227,34 +410,141 @@ class ResidualBlock(tf.keras.layers.Layer):
         'use_sync_bn': self._use_sync_bn,
         'norm_momentum': self._norm_momentum,
         'norm_epsilon': self._norm_epsilon,
-        'bn_trainable': self._bn_trainable
+        'bn_trainable': self._bn_trainable,
+        'jit_compile': self._jit_compile,
+        'preact': self._preact,
     }
     base_config = super(ResidualBlock, self).get_config()
     return dict(list(base_config.items()) + list(config.items()))
 
+  def reparameterize_for_inference(self):
+    """Folds batch norms and activations into the convolutions.
+
+    Must be called after the block is built and its weights are restored. The
+    block computes the same inference outputs afterwards but can no longer be
+    trained.
+
+    When the projection shortcut samples the same positions as the first 3x3
+    conv (`strides == 1` or explicit padding), the folded 1x1 shortcut is also
+    merged into that conv as extra output channels, so both branches read the
+    input once. The identity shortcut cannot be merged because of the
+    activation between the two 3x3 convs.
+
+    With `preact`, only the batch norm and activation after `_conv1` are
+    folded. The input batch norm precedes the zero padding of `_conv1` and
+    the shortcut branch, so it is kept.
+
+    Raises:
+      ValueError: If the block has not been built.
+    """
+    if not self.built:
+      raise ValueError('The block must be built before reparameterization.')
+    if self._inference_fused:
+      return
+
+    if self._preact:
+      self._conv1 = _fuse_conv_and_norm(self._conv1, self._norm2,
+                                        self._activation_fn)
+      del self._norm2
+      self._inference_fused = True
+      if self._jit_call is not None:
+        self._jit_call = tf.function(self._forward, jit_compile=True)
+      return
+
+    merge_shortcut = self._use_projection and (
+        self._strides == 1 or self._use_explicit_padding)
+    if self._use_projection:
+      self._shortcut = _fuse_conv_and_norm(self._shortcut, self._norm0)
+      del self._norm0
+    self._conv1 = _fuse_conv_and_norm(
+        self._conv1, self._norm1,
+        None if merge_shortcut else self._activation_fn)
+    if merge_shortcut:
+      self._conv1 = _merge_pointwise_conv(self._conv1, self._shortcut)
+      del self._shortcut
+    self._conv2 = _fuse_conv_and_norm(self._conv2, self._norm2)
+    del self._norm1, self._norm2
+    self._inference_fused = True
+    self._shortcut_merged = merge_shortcut
+    if self._jit_call is not None:
+      # Retrace so the compiled function picks up the fused layers.
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+
+  def _explicit_padding_conv1(self, inputs):
+    """Applies `_conv1` with a 1-pixel zero padding fused into the conv op."""
+    x = tf.nn.conv2d(
+        inputs,
+        self._conv1.kernel,
+        strides=self._strides,
+        padding=[[0, 0], [1, 1], [1, 1], [0, 0]])
+    if self._conv1.use_bias:
+      x = tf.nn.bias_add(x, self._conv1.bias)
+    return self._conv1.activation(x)
+
   def call(self, inputs, training=None):
+    if self._jit_call is not None:
+      return self._jit_call(inputs, training=training)
+    return self._forward(inputs, training=training)
+
+  def _forward(self, inputs, training=None):
+    if self._preact:
+      return self._forward_preact(inputs, training=training)
+
     shortcut = inputs
-    if self._use_projection:
+    if self._use_projection and not self._shortcut_merged:
       shortcut = self._shortcut(shortcut)
-      shortcut = self._norm0(shortcut)
+      if not self._inference_fused:
+        shortcut = self._norm0(shortcut)
 
     if self._use_explicit_padding:
-      inputs = self._pad(inputs)
-    x = self._conv1(inputs)
-    x = self._norm1(x)
-    x = self._activation_fn(x)
+      x = self._explicit_padding_conv1(inputs)
+    else:
+      x = self._conv1(inputs)
+    if self._shortcut_merged:
+      x, shortcut = tf.split(x, 2, axis=-1)
+      x = self._activation_fn(x)
+    elif not self._inference_fused:
+      x = self._norm1(x)
+      x = self._activation_fn(x)
 
     x = self._conv2(x)
-    x = self._norm2(x)
+    if not self._inference_fused:
+      x = self._norm2(x)
 
     if self._squeeze_excitation:
       x = self._squeeze_excitation(x)
 
-    if self._stochastic_depth:
+    if self._stochastic_depth and _resolve_training(training):
       x = self._stochastic_depth(x, training=training)
 
     return self._activation_fn(x + shortcut)
 
+  def _forward_preact(self, inputs, training=None):
+    x = self._norm1(inputs)
+    x = self._activation_fn(x)
+
+    shortcut = inputs
+    if self._use_projection:
+      shortcut = self._shortcut(x)
+
+    if self._use_explicit_padding:
+      x = self._explicit_padding_conv1(x)
+    else:
+      x = self._conv1(x)
+    if not self._inference_fused:
+      x = self._norm2(x)
+      x = self._activation_fn(x)
+
+    x = self._conv2(x)
+
+    if self._squeeze_excitation:
+      x = self._squeeze_excitation(x)
+
+    if self._stochastic_depth and _resolve_training(training):
+      x = self._stochastic_depth(x, training=training)
+
+    return x + shortcut
+
 
 @tf.keras.utils.register_keras_serializable(package='Vision')
 class BottleneckBlock(tf.keras.layers.Layer):
@@ -276,6 +566,7 @@ class BottleneckBlock(tf.keras.layers.Layer):
                norm_momentum=0.99,
                norm_epsilon=0.001,
                bn_trainable=True,
+               jit_compile=False,
                **kwargs):
     """Initializes a standard bottleneck block with BN after convolutions.
 
@@ -306,6 +597,9 @@ class BottleneckBlock(tf.keras.layers.Layer):
       norm_epsilon: A `float` added to variance to avoid dividing by zero.
       bn_trainable: A `bool` that indicates whether batch norm layers should be
         trainable. Default to True.
+      jit_compile: A `bool`. If True, compile the block's forward pass with XLA
+        so that its convolutions, batch norms and activations are fused into
+        a few kernels. Ignored when stochastic depth is enabled.
       **kwargs: Additional keyword arguments to be passed.
     """
     super(BottleneckBlock, self).__init__(**kwargs)
@@ -324,15 +618,16 @@ class BottleneckBlock(tf.keras.layers.Layer):
     self._norm_epsilon = norm_epsilon
     self._kernel_regularizer = kernel_regularizer
     self._bias_regularizer = bias_regularizer
-    self._norm = tf.keras.layers.BatchNormalization
+    self._norm = _get_batch_norm(use_sync_bn)
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._bn_axis = -1
-    else:
-      self._bn_axis = 1
+    self._bn_axis = -1
     self._bn_trainable = bn_trainable
+    self._jit_compile = jit_compile
+    self._inference_fused = False
 
   def build(self, input_shape):
+    check_channels_last(self)
+
     if self._use_projection:
       if self._resnetd_shortcut:
         self._shortcut0 = tf.keras.layers.AveragePooling2D(
@@ -438,7 +733,11 @@ class BottleneckBlock(tf.keras.layers.Layer):
           self._stochastic_depth_drop_rate)
     else:
       self._stochastic_depth = None
-    self._add = tf.keras.layers.Add()
+
+    if self._jit_compile and not self._stochastic_depth:
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+    else:
+      self._jit_call = None
 
     super(BottleneckBlock, self).build(input_shape)
 
@@ -458,12 +757,49 @@ class BottleneckBlock(tf.keras.layers.Layer):
         'use_sync_bn': self._use_sync_bn,
         'norm_momentum': self._norm_momentum,
         'norm_epsilon': self._norm_epsilon,
-        'bn_trainable': self._bn_trainable
+        'bn_trainable': self._bn_trainable,
+        'jit_compile': self._jit_compile
     }
     base_config = super(BottleneckBlock, self).get_config()
     return dict(list(base_config.items()) + list(config.items()))
 
+  def reparameterize_for_inference(self):
+    """Folds batch norms and activations into the convolutions.
+
+    Must be called after the block is built and its weights are restored. The
+    block computes the same inference outputs afterwards but can no longer be
+    trained.
+
+    Raises:
+      ValueError: If the block has not been built.
+    """
+    if not self.built:
+      raise ValueError('The block must be built before reparameterization.')
+    if self._inference_fused:
+      return
+
+    activation_fn = tf_utils.get_activation(self._activation)
+    if self._use_projection:
+      if self._resnetd_shortcut:
+        self._shortcut1 = _fuse_conv_and_norm(self._shortcut1, self._norm0)
+      else:
+        self._shortcut = _fuse_conv_and_norm(self._shortcut, self._norm0)
+      del self._norm0
+    self._conv1 = _fuse_conv_and_norm(self._conv1, self._norm1, activation_fn)
+    self._conv2 = _fuse_conv_and_norm(self._conv2, self._norm2, activation_fn)
+    self._conv3 = _fuse_conv_and_norm(self._conv3, self._norm3)
+    del self._norm1, self._norm2, self._norm3
+    self._inference_fused = True
+    if self._jit_call is not None:
+      # Retrace so the compiled function picks up the fused layers.
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+
   def call(self, inputs, training=None):
+    if self._jit_call is not None:
+      return self._jit_call(inputs, training=training)
+    return self._forward(inputs, training=training)
+
+  def _forward(self, inputs, training=None):
     shortcut = inputs
     if self._use_projection:
       if self._resnetd_shortcut:
@@ -471,32 +807,43 @@ class BottleneckBlock(tf.keras.layers.Layer):
         shortcut = self._shortcut1(shortcut)
       else:
         shortcut = self._shortcut(shortcut)
-      shortcut = self._norm0(shortcut)
+      if not self._inference_fused:
+        shortcut = self._norm0(shortcut)
 
     x = self._conv1(inputs)
-    x = self._norm1(x)
-    x = self._activation1(x)
+    if not self._inference_fused:
+      x = self._norm1(x)
+      x = self._activation1(x)
 
     x = self._conv2(x)
-    x = self._norm2(x)
-    x = self._activation2(x)
+    if not self._inference_fused:
+      x = self._norm2(x)
+      x = self._activation2(x)
 
     x = self._conv3(x)
-    x = self._norm3(x)
+    if not self._inference_fused:
+      x = self._norm3(x)
 
     if self._squeeze_excitation:
       x = self._squeeze_excitation(x)
 
-    if self._stochastic_depth:
+    if self._stochastic_depth and _resolve_training(training):
       x = self._stochastic_depth(x, training=training)
 
-    x = self._add([x, shortcut])
+    x = x + shortcut
     return self._activation3(x)
 
 
 @tf.keras.utils.register_keras_serializable(package='Vision')
 class InvertedBottleneckBlock(tf.keras.layers.Layer):
-  """An inverted bottleneck block."""
+  """An inverted bottleneck block.
+
+  For INT8 inference, quantization-aware training in `official/projects/qat`
+  replaces this block with `InvertedBottleneckBlockQuantized`, which fake
+  quantizes the expand, depthwise and projection convolutions. The trained
+  model is then exported with `export_tflite_lib.convert_tflite_model` using
+  `quant_type='int8_full'` to run on the integer-only TFLite kernels.
+  """
 
   def __init__(self,
                in_filters,
@@ -524,6 +871,8 @@ class InvertedBottleneckBlock(tf.keras.layers.Layer):
                norm_momentum=0.99,
                norm_epsilon=0.001,
                output_intermediate_endpoints=False,
+               fuse_squeeze_excitation=False,
+               jit_compile=False,
                **kwargs):
     """Initializes an inverted bottleneck block with BN after convolutions.
 
@@ -561,14 +910,25 @@ class InvertedBottleneckBlock(tf.keras.layers.Layer):
         all spatial dimensions.
       regularize_depthwise: A `bool` of whether or not apply regularization on
         depthwise.
-      use_depthwise: A `bool` of whether to uses fused convolutions instead of
-        depthwise.
+      use_depthwise: A `bool` of whether to use a 1x1 expansion followed by a
+        depthwise convolution. If False, the two are replaced by a single
+        `kernel_size` expansion convolution (Fused-MBConv), which avoids
+        writing and re-reading the expanded tensor and is usually faster for
+        small `expand_ratio` and early, high-resolution stages.
       use_residual: A `bool` of whether to include residual connection between
         input and output.
       norm_momentum: A `float` of normalization momentum for the moving average.
       norm_epsilon: A `float` added to variance to avoid dividing by zero.
       output_intermediate_endpoints: A `bool` of whether or not output the
         intermediate endpoints.
+      fuse_squeeze_excitation: A `bool`. If True, fold the squeeze and
+        excitation gate into the kernel of the last 1x1 conv per example
+        instead of multiplying it into the expanded feature map, which saves a
+        full read and write of that tensor when the spatial size is larger
+        than `out_filters`.
+      jit_compile: A `bool`. If True, compile the block's forward pass with XLA
+        so that its convolutions, batch norms and activations are fused into
+        a few kernels. Ignored when stochastic depth is enabled.
       **kwargs: Additional keyword arguments to be passed.
     """
     super(InvertedBottleneckBlock, self).__init__(**kwargs)
@@ -598,20 +958,24 @@ class InvertedBottleneckBlock(tf.keras.layers.Layer):
     self._bias_regularizer = bias_regularizer
     self._expand_se_in_filters = expand_se_in_filters
     self._output_intermediate_endpoints = output_intermediate_endpoints
-    self._norm = tf.keras.layers.BatchNormalization
+    self._fuse_squeeze_excitation = fuse_squeeze_excitation
+    self._jit_compile = jit_compile
+    self._norm = _get_batch_norm(use_sync_bn)
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._bn_axis = -1
-    else:
-      self._bn_axis = 1
+    self._bn_axis = -1
     if not depthwise_activation:
       self._depthwise_activation = activation
     if regularize_depthwise:
       self._depthsize_regularizer = kernel_regularizer
     else:
       self._depthsize_regularizer = None
+    self._use_residual_effective = (
+        use_residual and in_filters == out_filters and strides == 1)
+    self._inference_fused = False
 
   def build(self, input_shape):
+    check_channels_last(self)
+
     expand_filters = self._in_filters
     if self._expand_ratio > 1:
       # First 1x1 conv for channel expansion.
@@ -693,6 +1057,10 @@ class InvertedBottleneckBlock(tf.keras.layers.Layer):
         kernel_initializer=tf_utils.clone_initializer(self._kernel_initializer),
         kernel_regularizer=self._kernel_regularizer,
         bias_regularizer=self._bias_regularizer)
+    if self._squeeze_excitation and self._fuse_squeeze_excitation:
+      # The fused path reads the kernel directly instead of calling the layer.
+      with tf.name_scope(self._conv2.name):
+        self._conv2.build(tf.TensorShape([None, None, None, expand_filters]))
     self._norm2 = self._norm(
         axis=self._bn_axis,
         momentum=self._norm_momentum,
@@ -705,7 +1073,11 @@ class InvertedBottleneckBlock(tf.keras.layers.Layer):
           self._stochastic_depth_drop_rate)
     else:
       self._stochastic_depth = None
-    self._add = tf.keras.layers.Add()
+
+    if self._jit_compile and not self._stochastic_depth:
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+    else:
+      self._jit_call = None
 
     super(InvertedBottleneckBlock, self).build(input_shape)
 
@@ -735,39 +1107,92 @@ class InvertedBottleneckBlock(tf.keras.layers.Layer):
         'use_residual': self._use_residual,
         'norm_momentum': self._norm_momentum,
         'norm_epsilon': self._norm_epsilon,
-        'output_intermediate_endpoints': self._output_intermediate_endpoints
+        'output_intermediate_endpoints': self._output_intermediate_endpoints,
+        'fuse_squeeze_excitation': self._fuse_squeeze_excitation,
+        'jit_compile': self._jit_compile
     }
     base_config = super(InvertedBottleneckBlock, self).get_config()
     return dict(list(base_config.items()) + list(config.items()))
 
+  def reparameterize_for_inference(self):
+    """Folds batch norms and activations into the convolutions.
+
+    Must be called after the block is built and its weights are restored. The
+    block computes the same inference outputs afterwards but can no longer be
+    trained.
+
+    Raises:
+      ValueError: If the block has not been built.
+    """
+    if not self.built:
+      raise ValueError('The block must be built before reparameterization.')
+    if self._inference_fused:
+      return
+
+    if self._expand_ratio > 1:
+      self._conv0 = _fuse_conv_and_norm(
+          self._conv0, self._norm0, tf_utils.get_activation(self._activation))
+      del self._norm0
+    if self._use_depthwise:
+      self._conv1 = _fuse_conv_and_norm(
+          self._conv1, self._norm1,
+          tf_utils.get_activation(self._depthwise_activation))
+      del self._norm1
+    self._conv2 = _fuse_conv_and_norm(self._conv2, self._norm2)
+    del self._norm2
+    self._inference_fused = True
+    if self._jit_call is not None:
+      # Retrace so the compiled function picks up the fused layers.
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+
+  def _squeeze_excite_and_project(self, x):
+    """Applies squeeze and excitation and the last 1x1 conv as one matmul."""
+    gate = self._squeeze_excitation(x, return_gate=True)
+    # conv2(x * gate) == x @ (gate * kernel), with a per-example kernel.
+    kernel = tf.cast(self._conv2.kernel[0, 0], x.dtype)
+    kernel = tf.squeeze(gate, axis=[1, 2])[:, :, tf.newaxis] * kernel
+    x = tf.einsum('bhwc,bco->bhwo', x, kernel)
+    if self._conv2.use_bias:
+      x = tf.nn.bias_add(x, tf.cast(self._conv2.bias, x.dtype))
+    return x
+
   def call(self, inputs, training=None):
+    if self._jit_call is not None:
+      return self._jit_call(inputs, training=training)
+    return self._forward(inputs, training=training)
+
+  def _forward(self, inputs, training=None):
     endpoints = {}
     shortcut = inputs
     if self._expand_ratio > 1:
       x = self._conv0(inputs)
-      x = self._norm0(x)
-      x = self._activation_layer(x)
+      if not self._inference_fused:
+        x = self._norm0(x)
+        x = self._activation_layer(x)
     else:
       x = inputs
 
     if self._use_depthwise:
       x = self._conv1(x)
-      x = self._norm1(x)
-      x = self._depthwise_activation_layer(x)
+      if not self._inference_fused:
+        x = self._norm1(x)
+        x = self._depthwise_activation_layer(x)
       if self._output_intermediate_endpoints:
         endpoints['depthwise'] = x
 
-    if self._squeeze_excitation:
-      x = self._squeeze_excitation(x)
-
-    x = self._conv2(x)
-    x = self._norm2(x)
-
-    if (self._use_residual and self._in_filters == self._out_filters and
-        self._strides == 1):
-      if self._stochastic_depth:
+    if self._squeeze_excitation and self._fuse_squeeze_excitation:
+      x = self._squeeze_excite_and_project(x)
+    else:
+      if self._squeeze_excitation:
+        x = self._squeeze_excitation(x)
+      x = self._conv2(x)
+    if not self._inference_fused:
+      x = self._norm2(x)
+
+    if self._use_residual_effective:
+      if self._stochastic_depth and _resolve_training(training):
         x = self._stochastic_depth(x, training=training)
-      x = self._add([x, shortcut])
+      x = x + shortcut
 
     if self._output_intermediate_endpoints:
       return x, endpoints
@@ -824,15 +1249,15 @@ class ResidualInner(tf.keras.layers.Layer):
     self._norm_momentum = norm_momentum
     self._norm_epsilon = norm_epsilon
     self._batch_norm_first = batch_norm_first
-    self._norm = tf.keras.layers.BatchNormalization
+    self._norm = _get_batch_norm(use_sync_bn)
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._bn_axis = -1
-    else:
-      self._bn_axis = 1
+    self._bn_axis = -1
     self._activation_fn = tf_utils.get_activation(activation)
+    self._inference_fused = False
 
   def build(self, input_shape: tf.TensorShape):
+    check_channels_last(self)
+
     if self._batch_norm_first:
       self._batch_norm_0 = self._norm(
           axis=self._bn_axis,
@@ -883,6 +1308,29 @@ class ResidualInner(tf.keras.layers.Layer):
     base_config = super(ResidualInner, self).get_config()
     return dict(list(base_config.items()) + list(config.items()))
 
+  def reparameterize_for_inference(self):
+    """Folds batch norms and activations into the convolutions.
+
+    Must be called after the block is built and its weights are restored. The
+    block computes the same inference outputs afterwards but can no longer be
+    trained.
+
+    The batch norm applied to the inputs when `batch_norm_first` is True
+    precedes the zero padding of the first convolution, so it is kept.
+
+    Raises:
+      ValueError: If the block has not been built.
+    """
+    if not self.built:
+      raise ValueError('The block must be built before reparameterization.')
+    if self._inference_fused:
+      return
+
+    self._conv2d_1 = _fuse_conv_and_norm(self._conv2d_1, self._batch_norm_1,
+                                         self._activation_fn)
+    del self._batch_norm_1
+    self._inference_fused = True
+
   def call(self,
            inputs: tf.Tensor,
            training: Optional[bool] = None) -> tf.Tensor:
@@ -892,8 +1340,9 @@ class ResidualInner(tf.keras.layers.Layer):
       x = self._activation_fn(x)
     x = self._conv2d_1(x)
 
-    x = self._batch_norm_1(x, training=training)
-    x = self._activation_fn(x)
+    if not self._inference_fused:
+      x = self._batch_norm_1(x, training=training)
+      x = self._activation_fn(x)
     x = self._conv2d_2(x)
     return x
 
@@ -920,6 +1369,7 @@ class BottleneckResidualInner(tf.keras.layers.Layer):
       norm_momentum: float = 0.99,
       norm_epsilon: float = 0.001,
       batch_norm_first: bool = True,
+      jit_compile: bool = False,
       **kwargs):
     """Initializes a BottleneckResidualInner.
 
@@ -937,6 +1387,9 @@ class BottleneckResidualInner(tf.keras.layers.Layer):
       norm_epsilon: A `float` added to variance to avoid dividing by zero.
       batch_norm_first: A `bool` of whether to apply activation and batch norm
         before conv.
+      jit_compile: A `bool`. If True, compile the block's forward pass with XLA
+        so that its convolutions, batch norms and activations are fused into
+        a few kernels.
       **kwargs: Additional keyword arguments to be passed.
     """
     super(BottleneckResidualInner, self).__init__(**kwargs)
@@ -950,15 +1403,16 @@ class BottleneckResidualInner(tf.keras.layers.Layer):
     self._norm_momentum = norm_momentum
     self._norm_epsilon = norm_epsilon
     self._batch_norm_first = batch_norm_first
-    self._norm = tf.keras.layers.BatchNormalization
+    self._jit_compile = jit_compile
+    self._norm = _get_batch_norm(use_sync_bn)
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._bn_axis = -1
-    else:
-      self._bn_axis = 1
+    self._bn_axis = -1
     self._activation_fn = tf_utils.get_activation(activation)
+    self._inference_fused = False
 
   def build(self, input_shape: tf.TensorShape):
+    check_channels_last(self)
+
     if self._batch_norm_first:
       self._batch_norm_0 = self._norm(
           axis=self._bn_axis,
@@ -1003,6 +1457,11 @@ class BottleneckResidualInner(tf.keras.layers.Layer):
         kernel_initializer=tf_utils.clone_initializer(self._kernel_initializer),
         kernel_regularizer=self._kernel_regularizer)
 
+    if self._jit_compile:
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+    else:
+      self._jit_call = None
+
     super(BottleneckResidualInner, self).build(input_shape)
 
   def get_config(self) -> Dict[str, Any]:
@@ -1016,25 +1475,63 @@ class BottleneckResidualInner(tf.keras.layers.Layer):
         'norm_momentum': self._norm_momentum,
         'norm_epsilon': self._norm_epsilon,
         'batch_norm_first': self._batch_norm_first,
+        'jit_compile': self._jit_compile,
     }
     base_config = super(BottleneckResidualInner, self).get_config()
     return dict(list(base_config.items()) + list(config.items()))
 
+  def reparameterize_for_inference(self):
+    """Folds batch norms and activations into the convolutions.
+
+    Must be called after the block is built and its weights are restored. The
+    block computes the same inference outputs afterwards but can no longer be
+    trained.
+
+    The batch norm applied to the inputs when `batch_norm_first` is True
+    precedes the zero padding of the first convolution, so it is kept.
+
+    Raises:
+      ValueError: If the block has not been built.
+    """
+    if not self.built:
+      raise ValueError('The block must be built before reparameterization.')
+    if self._inference_fused:
+      return
+
+    self._conv2d_1 = _fuse_conv_and_norm(self._conv2d_1, self._batch_norm_1,
+                                         self._activation_fn)
+    self._conv2d_2 = _fuse_conv_and_norm(self._conv2d_2, self._batch_norm_2,
+                                         self._activation_fn)
+    del self._batch_norm_1, self._batch_norm_2
+    self._inference_fused = True
+    if self._jit_call is not None:
+      # Retrace so the compiled function picks up the fused layers.
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+
   def call(self,
            inputs: tf.Tensor,
            training: Optional[bool] = None) -> tf.Tensor:
+    if self._jit_call is not None:
+      return self._jit_call(inputs, training=training)
+    return self._forward(inputs, training=training)
+
+  def _forward(self,
+               inputs: tf.Tensor,
+               training: Optional[bool] = None) -> tf.Tensor:
     x = inputs
     if self._batch_norm_first:
       x = self._batch_norm_0(x, training=training)
       x = self._activation_fn(x)
     x = self._conv2d_1(x)
 
-    x = self._batch_norm_1(x, training=training)
-    x = self._activation_fn(x)
+    if not self._inference_fused:
+      x = self._batch_norm_1(x, training=training)
+      x = self._activation_fn(x)
     x = self._conv2d_2(x)
 
-    x = self._batch_norm_2(x, training=training)
-    x = self._activation_fn(x)
+    if not self._inference_fused:
+      x = self._batch_norm_2(x, training=training)
+      x = self._activation_fn(x)
     x = self._conv2d_3(x)
 
     return x
@@ -1074,11 +1571,11 @@ class ReversibleLayer(tf.keras.layers.Layer):
     self._f = f
     self._g = g
     self._manual_grads = manual_grads
+    self._axis = -1
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._axis = -1
-    else:
-      self._axis = 1
+  def build(self, input_shape):
+    check_channels_last(self)
+    super(ReversibleLayer, self).build(input_shape)
 
   def get_config(self) -> Dict[str, Any]:
     config = {
@@ -1105,10 +1602,29 @@ class ReversibleLayer(tf.keras.layers.Layer):
                           self._g_non_trainable_vars):
       v.assign(v_chkpt)
 
+  def _forward(
+      self,
+      x: tf.Tensor,
+      training: Optional[bool] = None
+  ) -> Tuple[tf.Tensor, tf.Tensor, tf.Tensor]:
+    """Computes y1, y2 and y = [y1; y2] from x = [x1; x2]."""
+    x1, x2 = tf.split(x, num_or_size_splits=2, axis=self._axis)
+    f_x2 = self._f(x2, training=training)
+    x1_down = _maybe_downsample(x1, f_x2.shape[self._axis], self._f.strides)
+    z1 = f_x2 + x1_down
+    g_z1 = self._g(z1, training=training)
+    x2_down = _maybe_downsample(x2, g_z1.shape[self._axis], self._f.strides)
+    y2 = x2_down + g_z1
+
+    # Equation 8: https://arxiv.org/pdf/1707.04585.pdf
+    # Decouple y1 and z1 so that their derivatives are different.
+    y1 = tf.identity(z1)
+    y = tf.concat([y1, y2], axis=self._axis)
+    return y1, y2, y
+
   def call(self,
            inputs: tf.Tensor,
            training: Optional[bool] = None) -> tf.Tensor:
-
     @tf.custom_gradient
     def reversible(
         x: tf.Tensor
@@ -1128,40 +1644,47 @@ class ReversibleLayer(tf.keras.layers.Layer):
         y: The output [y1; y2] in Algorithm 1.
         grad_fn: A callable function that computes the gradients.
       """
+      # Stride-1 layers, and every layer when deferring to autograd, recompute
+      # f/g in grad_fn instead of keeping their activations alive on a
+      # forward tape.
+      recompute = (not self._manual_grads or
+                   (self._f.strides == 1 and self._g.strides == 1))
       with tf.GradientTape() as fwdtape:
         fwdtape.watch(x)
-        x1, x2 = tf.split(x, num_or_size_splits=2, axis=self._axis)
-        f_x2 = self._f(x2, training=training)
-        x1_down = _maybe_downsample(x1, f_x2.shape[self._axis], self._f.strides,
-                                    self._axis)
-        z1 = f_x2 + x1_down
-        g_z1 = self._g(z1, training=training)
-        x2_down = _maybe_downsample(x2, g_z1.shape[self._axis], self._f.strides,
-                                    self._axis)
-        y2 = x2_down + g_z1
-
-        # Equation 8: https://arxiv.org/pdf/1707.04585.pdf
-        # Decouple y1 and z1 so that their derivatives are different.
-        y1 = tf.identity(z1)
-        y = tf.concat([y1, y2], axis=self._axis)
-
-        irreversible = ((self._f.strides != 1 or self._g.strides != 1) or
-                        (y.shape[self._axis] != inputs.shape[self._axis]))
-
-        # Checkpointing moving mean/variance for batch normalization layers
-        # as they shouldn't be updated during the custom gradient pass of f/g.
-        self._ckpt_non_trainable_vars()
+        if recompute:
+          with fwdtape.stop_recording():
+            y1, y2, y = self._forward(x, training=training)
+        else:
+          y1, y2, y = self._forward(x, training=training)
+
+      irreversible = ((self._f.strides != 1 or self._g.strides != 1) or
+                      (y.shape[self._axis] != inputs.shape[self._axis]))
+
+      # Checkpointing moving mean/variance for batch normalization layers
+      # as they shouldn't be updated during the custom gradient pass of f/g.
+      self._ckpt_non_trainable_vars()
 
       def grad_fn(
           dy: tf.Tensor,
           variables: Optional[List[tf.Variable]] = None,
       ) -> Tuple[List[tf.Tensor], List[tf.Tensor]]:
         """Given dy calculate (dy/dx)|_{x_{input}} using f/g."""
-        if irreversible or not self._manual_grads:
+        if not recompute:
           grads_combined = fwdtape.gradient(
               y, [x] + variables, output_gradients=dy)
           dx = grads_combined[0]
           grad_vars = grads_combined[1:]
+        elif irreversible or not self._manual_grads:
+          # Channel-changing layers cannot be inverted, so rerun the forward
+          # pass on the saved input. This is plain gradient checkpointing: only
+          # x is kept alive between the passes, not the f/g activations.
+          with tf.GradientTape() as tape:
+            tape.watch(x)
+            _, _, y_recomputed = self._forward(x, training=training)
+          grads_combined = tape.gradient(
+              y_recomputed, [x] + variables, output_gradients=dy)
+          dx = grads_combined[0]
+          grad_vars = grads_combined[1:]
         else:
           y1_nograd = tf.stop_gradient(y1)
           y2_nograd = tf.stop_gradient(y2)
@@ -1170,10 +1693,11 @@ class ReversibleLayer(tf.keras.layers.Layer):
           # Index mapping from self.f/g.trainable_variables to grad_fn
           # input `variables` kwarg so that we can reorder dwf + dwg
           # variable gradient list to match `variables` order.
-          f_var_refs = [v.ref() for v in self._f.trainable_variables]
-          g_var_refs = [v.ref() for v in self._g.trainable_variables]
-          fg_var_refs = f_var_refs + g_var_refs
-          self_to_var_index = [fg_var_refs.index(v.ref()) for v in variables]
+          fg_var_index = {
+              v.ref(): i for i, v in enumerate(
+                  self._f.trainable_variables + self._g.trainable_variables)
+          }
+          self_to_var_index = [fg_var_index[v.ref()] for v in variables]
 
           # Algorithm 1 in paper (line # documented in-line)
           z1 = y1_nograd  # line 2
@@ -1205,7 +1729,8 @@ class ReversibleLayer(tf.keras.layers.Layer):
           # Reorder gradients (trainable_variables to variables kwarg order)
           grad_vars = [grad_vars[i] for i in self_to_var_index]
 
-          # Restore batch normalization moving mean/variance for correctness.
+        # Restore batch normalization moving mean/variance for correctness.
+        if recompute:
           self._load_ckpt_non_trainable_vars()
 
         return dx, grad_vars  # grad_fn end
@@ -1271,17 +1796,15 @@ class DepthwiseSeparableConvBlock(tf.keras.layers.Layer):
     self._use_sync_bn = use_sync_bn
     self._norm_momentum = norm_momentum
     self._norm_epsilon = norm_epsilon
-    self._norm = tf.keras.layers.BatchNormalization
+    self._norm = _get_batch_norm(use_sync_bn)
 
-    if tf.keras.backend.image_data_format() == 'channels_last':
-      self._bn_axis = -1
-    else:
-      self._bn_axis = 1
+    self._bn_axis = -1
     self._activation_fn = tf_utils.get_activation(activation)
     if regularize_depthwise:
       self._depthsize_regularizer = kernel_regularizer
     else:
       self._depthsize_regularizer = None
+    self._inference_fused = False
 
   def get_config(self):
     config = {
@@ -1299,6 +1822,7 @@ class DepthwiseSeparableConvBlock(tf.keras.layers.Layer):
     return dict(list(base_config.items()) + list(config.items()))
 
   def build(self, input_shape):
+    check_channels_last(self)
 
     self._dwconv0 = tf.keras.layers.DepthwiseConv2D(
         kernel_size=self._kernel_size,
@@ -1333,7 +1857,32 @@ class DepthwiseSeparableConvBlock(tf.keras.layers.Layer):
 
     super(DepthwiseSeparableConvBlock, self).build(input_shape)
 
+  def reparameterize_for_inference(self):
+    """Folds batch norms and activations into the convolutions.
+
+    Must be called after the block is built and its weights are restored. The
+    block computes the same inference outputs afterwards but can no longer be
+    trained.
+
+    Raises:
+      ValueError: If the block has not been built.
+    """
+    if not self.built:
+      raise ValueError('The block must be built before reparameterization.')
+    if self._inference_fused:
+      return
+
+    self._dwconv0 = _fuse_conv_and_norm(self._dwconv0, self._norm0,
+                                        self._activation_fn)
+    self._conv1 = _fuse_conv_and_norm(self._conv1, self._norm1,
+                                      self._activation_fn)
+    del self._norm0, self._norm1
+    self._inference_fused = True
+
   def call(self, inputs, training=None):
+    if self._inference_fused:
+      return self._conv1(self._dwconv0(inputs))
+
     x = self._dwconv0(inputs)
     x = self._norm0(x)
     x = self._activation_fn(x)
@@ -1345,7 +1894,14 @@ class DepthwiseSeparableConvBlock(tf.keras.layers.Layer):
 
 @tf.keras.utils.register_keras_serializable(package='Vision')
 class TuckerConvBlock(tf.keras.layers.Layer):
-  """An Tucker block (generalized bottleneck)."""
+  """An Tucker block (generalized bottleneck).
+
+  For INT8 inference, export the trained model with
+  `export_tflite_lib.convert_tflite_model` using `quant_type='int8_full'`.
+  Post-training quantization folds each batch norm into its convolution,
+  fuses the activations and calibrates per-channel weight scales on the
+  representative dataset.
+  """
 
   def __init__(self,
                in_filters,
@@ -1419,6 +1975,7 @@ class TuckerConvBlock(tf.keras.layers.Layer):
       self._bn_axis = -1
     else:
       self._bn_axis = 1
+    self._inference_fused = False
 
   def build(self, input_shape):
     input_compressed_filters = nn_layers.make_divisible(
@@ -1515,19 +2072,44 @@ class TuckerConvBlock(tf.keras.layers.Layer):
     base_config = super(TuckerConvBlock, self).get_config()
     return dict(list(base_config.items()) + list(config.items()))
 
+  def reparameterize_for_inference(self):
+    """Folds batch norms and activations into the convolutions.
+
+    Must be called after the block is built and its weights are restored. The
+    block computes the same inference outputs afterwards but can no longer be
+    trained.
+
+    Raises:
+      ValueError: If the block has not been built.
+    """
+    if not self.built:
+      raise ValueError('The block must be built before reparameterization.')
+    if self._inference_fused:
+      return
+
+    activation_fn = tf_utils.get_activation(self._activation)
+    self._conv0 = _fuse_conv_and_norm(self._conv0, self._norm0, activation_fn)
+    self._conv1 = _fuse_conv_and_norm(self._conv1, self._norm1, activation_fn)
+    self._conv2 = _fuse_conv_and_norm(self._conv2, self._norm2)
+    del self._norm0, self._norm1, self._norm2
+    self._inference_fused = True
+
   def call(self, inputs, training=None):
     shortcut = inputs
 
     x = self._conv0(inputs)
-    x = self._norm0(x)
-    x = self._activation_layer0(x)
+    if not self._inference_fused:
+      x = self._norm0(x)
+      x = self._activation_layer0(x)
 
     x = self._conv1(x)
-    x = self._norm1(x)
-    x = self._activation_layer1(x)
+    if not self._inference_fused:
+      x = self._norm1(x)
+      x = self._activation_layer1(x)
 
     x = self._conv2(x)
-    x = self._norm2(x)
+    if not self._inference_fused:
+      x = self._norm2(x)
 
     if (self._use_residual and self._in_filters == self._out_filters and
         self._strides == 1):
@@ -1551,6 +2133,7 @@ class LayerScale(tf.keras.layers.Layer):
     """Initializes LayerScale."""
     super().__init__(**kwargs)
     self.gamma_init_value = init_values
+    self._folded = False
 
   def build(self, inputs_shape):
     gamma_shape = (1, 1, inputs_shape[2])
@@ -1562,11 +2145,31 @@ class LayerScale(tf.keras.layers.Layer):
         dtype=tf.float32,
     )
 
+  def fold_into(self, layer: tf.keras.layers.Layer):
+    """Folds the scale into the kernel and bias of the preceding projection.
+
+    `layer` must be a built `Dense` or `EinsumDense` whose output feeds this
+    layer and whose kernel and bias end with the output channel dimension.
+    Afterwards `gamma` is reset to ones and this layer returns its inputs
+    unchanged, so inference outputs are preserved.
+
+    Args:
+      layer: The projection layer applied right before this layer.
+    """
+    if self._folded:
+      return
+    gamma = tf.reshape(self.gamma, [-1])
+    layer.kernel.assign(layer.kernel * tf.cast(gamma, layer.kernel.dtype))
+    if layer.bias is not None:
+      layer.bias.assign(layer.bias * tf.cast(gamma, layer.bias.dtype))
+    self.gamma.assign(tf.ones_like(self.gamma))
+    self._folded = True
+
   def call(self, inputs, inputs_positions=None):
     del inputs_positions
-    input_dtype = inputs.dtype
-    gamma = self.gamma
-    return tf.cast(tf.cast(inputs, tf.float32) * gamma, input_dtype)
+    if self._folded:
+      return inputs
+    return inputs * tf.cast(self.gamma, inputs.dtype)
 
 
 @tf.keras.utils.register_keras_serializable(package='Vision')
@@ -1579,6 +2182,11 @@ class TransformerEncoderBlock(nlp_modeling.layers.TransformerEncoderBlock):
       stochastic_depth_drop_rate=0.0,
       layer_scale_init_value=0.0,
       max_attention_inference_parallelism=None,
+      max_attention_inference_query_chunk_size=None,
+      num_kv_heads=None,
+      fuse_add_and_norm=False,
+      max_inference_chunk_size=None,
+      jit_compile=False,
       **kwargs
   ):
     """Initializes TransformerEncoderBlock.
@@ -1591,6 +2199,24 @@ class TransformerEncoderBlock(nlp_modeling.layers.TransformerEncoderBlock):
         parallel in the attention blocks during inference. Set this limit to
         reduce the peak memory usage. If None, use vectorized operations to run
         the whole batch in parallel.
+      max_attention_inference_query_chunk_size: the number of query positions
+        to attend at once during inference. Set this limit to reduce the peak
+        memory usage for long sequences. If None, attend all positions at once.
+      num_kv_heads: the number of key and value heads for grouped-query
+        attention, which must divide the number of attention heads. If None,
+        use one key and value head per attention head.
+      fuse_add_and_norm: whether to compute the final residual add and output
+        layer norm of the post-norm block as one XLA-compiled kernel.
+      max_inference_chunk_size: the number of positions to run through the
+        MLP at once during inference, so that the MLP intermediate of only one
+        chunk is live at a time. Unless
+        `max_attention_inference_query_chunk_size` is set, it is also used as
+        the attention query chunk size; the keys and values are still
+        projected once for the whole sequence. If None, run all positions at
+        once.
+      jit_compile: whether to compile the block's forward pass with XLA so that
+        the attention, residual adds, layer norms and MLP are fused into a few
+        kernels. Ignored when stochastic depth is enabled.
       **kwargs: keyword arguments passed to super().__init__.
     """
     super().__init__(*args, **kwargs)
@@ -1599,13 +2225,20 @@ class TransformerEncoderBlock(nlp_modeling.layers.TransformerEncoderBlock):
     self._max_attention_inference_parallelism = (
         max_attention_inference_parallelism
     )
+    self._max_attention_inference_query_chunk_size = (
+        max_attention_inference_query_chunk_size
+    )
+    self._num_kv_heads = num_kv_heads
+    self._fuse_add_and_norm = fuse_add_and_norm
+    self._max_inference_chunk_size = max_inference_chunk_size
+    self._jit_compile = jit_compile
 
   def build(self, input_shape):
     if self._stochastic_depth_drop_rate:
       self._stochastic_depth = nn_layers.StochasticDepth(
           self._stochastic_depth_drop_rate)
     else:
-      self._stochastic_depth = lambda x, *args, **kwargs: tf.identity(x)
+      self._stochastic_depth = None
 
     if self._layer_scale_init_value:
       self._layer_scale_attn = LayerScale(
@@ -1613,19 +2246,34 @@ class TransformerEncoderBlock(nlp_modeling.layers.TransformerEncoderBlock):
       self._layer_scale_mlp = LayerScale(
           init_values=self._layer_scale_init_value, name='layer_scale_mlp')
     else:
-      self._layer_scale_attn = lambda x, *args, **kwargs: tf.identity(x)
-      self._layer_scale_mlp = lambda x, *args, **kwargs: tf.identity(x)
+      self._layer_scale_attn = None
+      self._layer_scale_mlp = None
     super().build(input_shape)
 
-    if self._max_attention_inference_parallelism is not None:
+    attention_query_chunk_size = self._max_attention_inference_query_chunk_size
+    if attention_query_chunk_size is None:
+      attention_query_chunk_size = self._max_inference_chunk_size
+    # Only the options that are set are passed to the attention layer.
+    attention_options = {
+        k: v for k, v in [
+            ('max_inference_parallelism',
+             self._max_attention_inference_parallelism),
+            ('max_inference_query_chunk_size', attention_query_chunk_size),
+            ('num_kv_heads', self._num_kv_heads),
+        ] if v is not None
+    }
+    if attention_options:
       attention_layer_config = self._attention_layer.get_config()
       self._attention_layer = nn_layers.MultiHeadAttention.from_config({
           **attention_layer_config,
-          'max_inference_parallelism': (
-              self._max_attention_inference_parallelism
-          ),
+          **attention_options,
       })
 
+    if self._jit_compile and not self._stochastic_depth:
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+    else:
+      self._jit_call = None
+
   def get_config(self):
     config = super().get_config()
     config.update({
@@ -1634,11 +2282,57 @@ class TransformerEncoderBlock(nlp_modeling.layers.TransformerEncoderBlock):
         'max_attention_inference_parallelism': (
             self._max_attention_inference_parallelism
         ),
+        'max_attention_inference_query_chunk_size': (
+            self._max_attention_inference_query_chunk_size
+        ),
+        'num_kv_heads': self._num_kv_heads,
+        'fuse_add_and_norm': self._fuse_add_and_norm,
+        'max_inference_chunk_size': self._max_inference_chunk_size,
+        'jit_compile': self._jit_compile,
     })
     return config
 
+  def _feedforward(self, attention_output, source_attention_output, training):
+    """Applies the MLP, its residual and, if post-norm, the output norm."""
+    inner_output = self._intermediate_dense(attention_output)
+    inner_output = self._intermediate_activation_layer(inner_output)
+    inner_output = self._inner_dropout_layer(inner_output)
+    layer_output = self._output_dense(inner_output)
+    layer_output = self._output_dropout(layer_output)
+
+    # Layerscale after MLP.
+    layer_output = _maybe_apply(self._layer_scale_mlp, layer_output)
+
+    if self._norm_first:
+      return source_attention_output + _maybe_apply(
+          self._stochastic_depth, layer_output, training=training)
+    elif self._fuse_add_and_norm:
+      return _add_and_layer_norm(
+          layer_output,
+          _maybe_apply(
+              self._stochastic_depth, attention_output, training=training),
+          self._output_layer_norm)
+    else:
+      # During mixed precision training, layer norm output is always fp32 for
+      # now. Casts fp32 for the subsequent add.
+      layer_output = tf.cast(layer_output, tf.float32)
+      return self._output_layer_norm(
+          layer_output + _maybe_apply(
+              self._stochastic_depth, attention_output, training=training))
+
   def call(self, inputs, output_range=None, training=None):
-    """Transformer self-attention encoder block call."""
+    """Transformer self-attention encoder block call.
+
+    The attention mask is of shape `(B, T, S)`, or `(B, 1, S)` for a padding
+    mask that is broadcast over the query positions instead of being
+    materialized per query.
+    """
+    if self._jit_call is not None:
+      return self._jit_call(
+          inputs, output_range=output_range, training=training)
+    return self._forward(inputs, output_range=output_range, training=training)
+
+  def _forward(self, inputs, output_range=None, training=None):
     if isinstance(inputs, (list, tuple)):
       if len(inputs) == 2:
         input_tensor, attention_mask = inputs
@@ -1656,8 +2350,12 @@ class TransformerEncoderBlock(nlp_modeling.layers.TransformerEncoderBlock):
     if output_range:
       if self._norm_first:
         source_tensor = input_tensor[:, 0:output_range, :]
-        input_tensor = self._attention_layer_norm(input_tensor)
-        if key_value is not None:
+        if key_value is None:
+          # Self-attention attends to the whole normalized sequence.
+          input_tensor = self._attention_layer_norm(input_tensor)
+        else:
+          # Only the queries in the output range are needed.
+          input_tensor = self._attention_layer_norm(source_tensor)
           key_value = self._attention_layer_norm(key_value)
       target_tensor = input_tensor[:, 0:output_range, :]
       if attention_mask is not None:
@@ -1680,42 +2378,41 @@ class TransformerEncoderBlock(nlp_modeling.layers.TransformerEncoderBlock):
         return_attention_scores=True)
     attention_output = self._attention_dropout(attention_output)
 
-    attention_output = self._layer_scale_attn(attention_output)
+    attention_output = _maybe_apply(self._layer_scale_attn, attention_output)
 
     if self._norm_first:
       # Important to not combine `self._norm_first` and
       # `self._use_query_residual` into one if clause because else is only for
       # `_norm_first == False`.
       if self._use_query_residual:
-        attention_output = source_tensor + self._stochastic_depth(
-            attention_output, training=training)
+        attention_output = source_tensor + _maybe_apply(
+            self._stochastic_depth, attention_output, training=training)
       source_attention_output = attention_output
       attention_output = self._output_layer_norm(attention_output)
     else:
       if self._use_query_residual:
-        attention_output = target_tensor + self._stochastic_depth(
-            attention_output, training=training)
+        attention_output = target_tensor + _maybe_apply(
+            self._stochastic_depth, attention_output, training=training)
       attention_output = self._attention_layer_norm(attention_output)
-
-    inner_output = self._intermediate_dense(attention_output)
-    inner_output = self._intermediate_activation_layer(inner_output)
-    inner_output = self._inner_dropout_layer(inner_output)
-    layer_output = self._output_dense(inner_output)
-    layer_output = self._output_dropout(layer_output)
-
-    # Layerscale after MLP.
-    layer_output = self._layer_scale_mlp(layer_output)
-
-    if self._norm_first:
-      layer_output = source_attention_output + self._stochastic_depth(
-          layer_output, training=training)
+      source_attention_output = None
+
+    chunk_size = self._max_inference_chunk_size
+    target_length = attention_output.shape[1]  # None if dynamic.
+    if (chunk_size and not training and target_length is not None and
+        target_length > chunk_size):
+      # The MLP is position-wise, so only one chunk of positions needs to go
+      # through its wide intermediate at a time.
+      layer_output = tf.concat([
+          self._feedforward(
+              attention_output[:, start:start + chunk_size],
+              source_attention_output[:, start:start + chunk_size]
+              if source_attention_output is not None else None,
+              training=training)
+          for start in range(0, target_length, chunk_size)
+      ], axis=1)
     else:
-      # During mixed precision training, layer norm output is always fp32 for
-      # now. Casts fp32 for the subsequent add.
-      layer_output = tf.cast(layer_output, tf.float32)
-      layer_output = self._output_layer_norm(
-          layer_output
-          + self._stochastic_depth(attention_output, training=training))
+      layer_output = self._feedforward(
+          attention_output, source_attention_output, training=training)
 
     if self._return_attention_scores:
       return layer_output, attention_scores
@@ -1734,6 +2431,10 @@ class TransformerScaffold(nlp_modeling.layers.TransformerScaffold):
       return_attention_scores: bool = False,
       ffn_has_residual_connection: bool = False,
       max_attention_inference_parallelism: Optional[int] = None,
+      max_attention_inference_query_chunk_size: Optional[int] = None,
+      num_kv_heads: Optional[int] = None,
+      fuse_add_and_norm: bool = False,
+      jit_compile: bool = False,
       **kwargs
   ):
     """Initializes TransformerEncoderBlock.
@@ -1749,6 +2450,17 @@ class TransformerScaffold(nlp_modeling.layers.TransformerScaffold):
         parallel in the attention blocks during inference. Set this limit to
         reduce the peak memory usage. If None, use vectorized operations to run
         the whole batch in parallel.
+      max_attention_inference_query_chunk_size: the number of query positions
+        to attend at once during inference. Set this limit to reduce the peak
+        memory usage for long sequences. If None, attend all positions at once.
+      num_kv_heads: the number of key and value heads for grouped-query
+        attention, which must divide the number of attention heads. If None,
+        use one key and value head per attention head.
+      fuse_add_and_norm: whether to compute the final residual add and output
+        layer norm of the post-norm block as one XLA-compiled kernel.
+      jit_compile: whether to compile the block's forward pass with XLA so that
+        the attention, residual adds, layer norms and feedforward network are
+        fused into a few kernels. Ignored when stochastic depth is enabled.
       **kwargs: keyword arguments passed to super().__init__.
     """
     super().__init__(*args, **kwargs)
@@ -1758,25 +2470,45 @@ class TransformerScaffold(nlp_modeling.layers.TransformerScaffold):
     self._max_attention_inference_parallelism = (
         max_attention_inference_parallelism
     )
+    self._max_attention_inference_query_chunk_size = (
+        max_attention_inference_query_chunk_size
+    )
+    self._num_kv_heads = num_kv_heads
+    self._fuse_add_and_norm = fuse_add_and_norm
+    self._jit_compile = jit_compile
 
   def build(self, input_shape: Union[tf.TensorShape, List[int]]):
     if self._stochastic_depth_drop_rate:
       self._stochastic_depth = nn_layers.StochasticDepth(
           self._stochastic_depth_drop_rate)
     else:
-      self._stochastic_depth = lambda x, *args, **kwargs: tf.identity(x)
+      self._stochastic_depth = None
 
     super().build(input_shape)
 
-    if self._max_attention_inference_parallelism is not None:
+    # Only the options that are set are passed to `attention_cls`, which may
+    # not accept the others.
+    attention_options = {
+        k: v for k, v in [
+            ('max_inference_parallelism',
+             self._max_attention_inference_parallelism),
+            ('max_inference_query_chunk_size',
+             self._max_attention_inference_query_chunk_size),
+            ('num_kv_heads', self._num_kv_heads),
+        ] if v is not None
+    }
+    if attention_options:
       attention_layer_config = self._attention_layer.get_config()
       self._attention_layer = self._attention_cls.from_config({
           **attention_layer_config,
-          'max_inference_parallelism': (
-              self._max_attention_inference_parallelism
-          ),
+          **attention_options,
       })
 
+    if self._jit_compile and not self._stochastic_depth:
+      self._jit_call = tf.function(self._forward, jit_compile=True)
+    else:
+      self._jit_call = None
+
   def get_config(self):
     config = super().get_config()
     config.update({
@@ -1786,15 +2518,51 @@ class TransformerScaffold(nlp_modeling.layers.TransformerScaffold):
         'max_attention_inference_parallelism': (
             self._max_attention_inference_parallelism
         ),
+        'max_attention_inference_query_chunk_size': (
+            self._max_attention_inference_query_chunk_size
+        ),
+        'num_kv_heads': self._num_kv_heads,
+        'fuse_add_and_norm': self._fuse_add_and_norm,
+        'jit_compile': self._jit_compile,
     })
     return config
 
   def call(
       self,
       inputs: tf.Tensor,
-      training: Optional[bool] = None
-  ) -> Union[tf.Tensor, Tuple[tf.Tensor, tf.Tensor]]:
-    """Transformer self-attention encoder block call."""
+      training: Optional[bool] = None,
+      cache: Optional[Dict[str, tf.Tensor]] = None,
+      decode_loop_step: Optional[int] = None,
+  ) -> Union[tf.Tensor, Tuple[Any, ...]]:
+    """Transformer self-attention encoder block call.
+
+    Args:
+      inputs: The input tensor, or a list of `[input_tensor, attention_mask]`
+        or `[input_tensor, key_value, attention_mask]`.
+      training: Whether the layer runs in training mode.
+      cache: An optional dict of the `key` and `value` projections of previous
+        decoding steps for autoregressive decoding. Requires an attention class
+        with caching support such as `nlp_modeling.layers.CachedAttention`.
+        Only the new positions are projected, and the dict is returned
+        updated.
+      decode_loop_step: An optional step index. If set, the cache is assumed to
+        be preallocated to the full length and updated in place at this step,
+        as required on TPU.
+
+    Returns:
+      The output tensor, followed by the attention scores if
+      `return_attention_scores` is True and by the updated cache if `cache` is
+      given.
+    """
+    if self._jit_call is not None:
+      return self._jit_call(
+          inputs, training=training, cache=cache,
+          decode_loop_step=decode_loop_step)
+    return self._forward(
+        inputs, training=training, cache=cache,
+        decode_loop_step=decode_loop_step)
+
+  def _forward(self, inputs, training=None, cache=None, decode_loop_step=None):
     if isinstance(inputs, (list, tuple)):
       if len(inputs) == 2:
         input_tensor, attention_mask = inputs
@@ -1814,24 +2582,36 @@ class TransformerScaffold(nlp_modeling.layers.TransformerScaffold):
     if key_value is None:
       key_value = input_tensor
 
-    attention_output, attention_scores = self._attention_layer(
-        query=input_tensor,
-        value=key_value,
-        attention_mask=attention_mask,
-        training=training,
-        return_attention_scores=True)
+    if cache is None:
+      # Caching attention layers such as `CachedAttention` also return their
+      # (unused) cache.
+      attention_output, attention_scores = self._attention_layer(
+          query=input_tensor,
+          value=key_value,
+          attention_mask=attention_mask,
+          training=training,
+          return_attention_scores=True)[:2]
+    else:
+      attention_output, attention_scores, cache = self._attention_layer(
+          query=input_tensor,
+          value=key_value,
+          attention_mask=attention_mask,
+          cache=cache,
+          decode_loop_step=decode_loop_step,
+          training=training,
+          return_attention_scores=True)
     attention_output = self._attention_dropout(
         attention_output, training=training)
 
     if self._norm_first:
-      source_attention_output = source_tensor + self._stochastic_depth(
-          attention_output, training=training)
+      source_attention_output = source_tensor + _maybe_apply(
+          self._stochastic_depth, attention_output, training=training)
       attention_output = self._output_layer_norm(
           source_attention_output)
     else:
       attention_output = self._attention_layer_norm(
-          input_tensor +
-          self._stochastic_depth(attention_output, training=training))
+          input_tensor + _maybe_apply(
+              self._stochastic_depth, attention_output, training=training))
 
     if self._feedforward_block is None:
       intermediate_output = self._intermediate_dense(attention_output)
@@ -1849,19 +2629,30 @@ class TransformerScaffold(nlp_modeling.layers.TransformerScaffold):
             'In the case of `norm_first`, the residual connection should be'
             "done in the TransformerScaffold call function, not FFN's"
             'call function.')
-      output = source_attention_output + self._stochastic_depth(
-          layer_output, training=training)
+      output = source_attention_output + _maybe_apply(
+          self._stochastic_depth, layer_output, training=training)
+    elif self._fuse_add_and_norm and not self._ffn_has_residual_connection:
+      output = _add_and_layer_norm(
+          attention_output,
+          _maybe_apply(
+              self._stochastic_depth, layer_output, training=training),
+          self._output_layer_norm)
     else:
       # During mixed precision training, layer norm output is always fp32 for
       # now. Casts fp32 for the subsequent add.
       layer_output = tf.cast(layer_output, tf.float32)
       if self._ffn_has_residual_connection:
-        output = self._stochastic_depth(layer_output, training=training)
+        output = _maybe_apply(
+            self._stochastic_depth, layer_output, training=training)
       else:
         output = self._output_layer_norm(
-            attention_output +
-            self._stochastic_depth(layer_output, training=training))
+            attention_output + _maybe_apply(
+                self._stochastic_depth, layer_output, training=training))
 
+    if cache is not None:
+      if self._return_attention_scores:
+        return output, attention_scores, cache
+      return output, cache
     if self._return_attention_scores:
       return output, attention_scores
     else:
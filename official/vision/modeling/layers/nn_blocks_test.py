@@ -24,6 +24,7 @@ import tensorflow as tf
 
 from tensorflow.python.distribute import combinations
 from tensorflow.python.distribute import strategy_combinations
+from official.nlp import modeling as nlp_modeling
 from official.vision.modeling.layers import nn_blocks
 from official.vision.modeling.layers import nn_layers
 
@@ -64,6 +65,141 @@ class NNBlocksTest(parameterized.TestCase, tf.test.TestCase):
         [1, input_size // strides, input_size // strides, filter_size],
         features.shape.as_list())
 
+  def test_residual_block_requires_channels_last(self):
+    tf.keras.backend.set_image_data_format('channels_first')
+    self.addCleanup(tf.keras.backend.set_image_data_format, 'channels_last')
+    block = nn_blocks.ResidualBlock(filters=8, strides=1)
+
+    with self.assertRaisesRegex(ValueError, 'channels_last'):
+      block.build([1, 8, 16, 16])
+
+  @parameterized.parameters(
+      (nn_blocks.ResidualBlock, dict(filters=16, strides=2,
+                                     use_projection=True)),
+      (nn_blocks.ResidualBlock, dict(filters=8, strides=1,
+                                     use_projection=True)),
+      (nn_blocks.ResidualBlock, dict(filters=8, strides=2,
+                                     use_projection=True,
+                                     use_explicit_padding=True)),
+      (nn_blocks.BottleneckBlock, dict(filters=4, strides=1,
+                                       use_projection=True,
+                                       resnetd_shortcut=True)),
+      (nn_blocks.InvertedBottleneckBlock, dict(in_filters=16, out_filters=16,
+                                               expand_ratio=6, strides=1,
+                                               se_ratio=0.25)),
+      (nn_blocks.ResidualInner, dict(filters=16, strides=1,
+                                     batch_norm_first=False)),
+      (nn_blocks.BottleneckResidualInner, dict(filters=4, strides=1,
+                                               batch_norm_first=False)),
+      (nn_blocks.DepthwiseSeparableConvBlock, dict(filters=16, strides=2)),
+      (nn_blocks.TuckerConvBlock, dict(in_filters=16, out_filters=16,
+                                       input_compression_ratio=0.25,
+                                       output_compression_ratio=0.25,
+                                       strides=1)),
+  )
+  def test_reparameterize_for_inference(self, block_fn, kwargs):
+    inputs = tf.random.normal([2, 16, 16, 16])
+    block = block_fn(**kwargs)
+    block(inputs, training=False)
+    for weight in block.non_trainable_weights + block.trainable_weights:
+      if 'batch_normalization' in weight.name:
+        weight.assign(tf.random.uniform(weight.shape, 0.5, 1.5))
+    expected = block(inputs, training=False)
+
+    block.reparameterize_for_inference()
+    actual = block(inputs, training=False)
+
+    self.assertNotIn('batch_normalization',
+                     ' '.join(w.name for w in block.weights))
+    self.assertAllClose(expected, actual, atol=1e-4, rtol=1e-4)
+
+  @parameterized.parameters(
+      (nn_blocks.ResidualBlock, dict(filters=16, strides=1,
+                                     use_projection=True)),
+      (nn_blocks.BottleneckBlock, dict(filters=4, strides=1,
+                                       use_projection=True)),
+      (nn_blocks.InvertedBottleneckBlock, dict(in_filters=16, out_filters=16,
+                                               expand_ratio=6, strides=1)),
+      (nn_blocks.ResidualInner, dict(filters=16, strides=1)),
+      (nn_blocks.BottleneckResidualInner, dict(filters=4, strides=1)),
+  )
+  def test_block_mixed_bfloat16(self, block_fn, kwargs):
+    tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
+    self.addCleanup(tf.keras.mixed_precision.set_global_policy, 'float32')
+    block = block_fn(**kwargs)
+
+    features = block(tf.random.normal([2, 16, 16, 16]), training=True)
+
+    self.assertEqual(features.dtype, tf.bfloat16)
+    for weight in block.weights:
+      self.assertEqual(weight.dtype, tf.float32)
+
+  @parameterized.parameters(
+      (nn_blocks.ResidualBlock, dict(filters=8, strides=1),
+       dict(jit_compile=True), [2, 16, 16, 8]),
+      (nn_blocks.BottleneckResidualInner, dict(filters=4, strides=1),
+       dict(jit_compile=True), [2, 16, 16, 16]),
+      (nn_blocks.InvertedBottleneckBlock,
+       dict(in_filters=8, out_filters=8, expand_ratio=4, strides=1,
+            se_ratio=0.25),
+       dict(fuse_squeeze_excitation=True), [2, 16, 16, 8]),
+      (nn_blocks.TransformerEncoderBlock,
+       dict(num_attention_heads=2, inner_dim=32, inner_activation='relu'),
+       dict(fuse_add_and_norm=True), [2, 21, 16]),
+      (nn_blocks.TransformerEncoderBlock,
+       dict(num_attention_heads=2, inner_dim=32, inner_activation='relu'),
+       dict(jit_compile=True), [2, 21, 16]),
+      (nn_blocks.TransformerScaffold,
+       dict(num_attention_heads=2, inner_dim=32, inner_activation='relu'),
+       dict(fuse_add_and_norm=True), [2, 21, 16]),
+      (nn_blocks.TransformerScaffold,
+       dict(num_attention_heads=2, inner_dim=32, inner_activation='relu'),
+       dict(jit_compile=True), [2, 21, 16]),
+  )
+  def test_block_variant_parity(self, block_fn, kwargs, variant_kwargs,
+                                input_shape):
+    inputs = tf.random.normal(input_shape)
+    block = block_fn(**kwargs)
+    variant_block = block_fn(**kwargs, **variant_kwargs)
+    expected = block(inputs, training=False)
+    variant_block(inputs, training=False)
+    variant_block.set_weights(block.get_weights())
+
+    actual = variant_block(inputs, training=False)
+
+    config = variant_block.get_config()
+    for key, value in variant_kwargs.items():
+      self.assertEqual(value, config[key])
+    self.assertAllClose(expected, actual, atol=1e-4, rtol=1e-4)
+
+  @parameterized.parameters(1, 2)
+  def test_residual_block_explicit_padding(self, strides):
+    inputs = tf.random.normal([1, 17, 17, 8])
+    block = nn_blocks.ResidualBlock(
+        filters=8, strides=strides, use_projection=True,
+        use_explicit_padding=True)
+
+    features = block(inputs)
+
+    expected_size = (17 + 2 - 3) // strides + 1
+    self.assertAllEqual([1, expected_size, expected_size, 8],
+                        features.shape.as_list())
+
+  @parameterized.parameters((1, False), (2, True))
+  def test_residual_block_preact(self, strides, use_projection):
+    inputs = tf.random.normal([2, 16, 16, 8])
+    block = nn_blocks.ResidualBlock(
+        filters=8, strides=strides, use_projection=use_projection,
+        preact=True)
+    expected = block(inputs, training=False)
+
+    block.reparameterize_for_inference()
+    actual = block(inputs, training=False)
+
+    self.assertAllEqual([2, 16 // strides, 16 // strides, 8],
+                        actual.shape.as_list())
+    self.assertAllClose(expected, actual, atol=1e-4, rtol=1e-4)
+
   def test_layerscale_call(self):
     # Set up test inputs
     input_shape = (2, 3, 4)
@@ -85,6 +221,19 @@ class NNBlocksTest(parameterized.TestCase, tf.test.TestCase):
     self.assertAllClose(
         output.numpy(), expected_output_values, rtol=1e-5, atol=1e-5)
 
+  def test_layerscale_fold_into(self):
+    inputs = tf.random.normal([2, 3, 4])
+    dense = tf.keras.layers.Dense(8)
+    layer_scale = nn_blocks.LayerScale(0.5)
+    layer_scale(dense(inputs))
+    layer_scale.gamma.assign(tf.random.uniform([1, 1, 8]))
+    expected = layer_scale(dense(inputs))
+
+    layer_scale.fold_into(dense)
+    actual = layer_scale(dense(inputs))
+
+    self.assertAllClose(expected, actual, atol=1e-5, rtol=1e-5)
+
   def test_layerscale_training(self):
     # Verify that gamma values have changed from their initial values in one
     # step forward pass.
@@ -386,6 +535,32 @@ class ReversibleLayerTest(parameterized.TestCase, tf.test.TestCase):
                                     auto_grad_layer.non_trainable_variables):
       self.assertAllClose(manual_var, auto_var)
 
+  def test_moving_stats_with_learning_phase(self):
+    bsz, h, w, c = 8, 32, 32, 32
+    input_tensor = tf.random.uniform(shape=[bsz, h, w, c])
+    f = nn_blocks.ResidualInner(
+        filters=c // 2, strides=1, batch_norm_first=True)
+    g = nn_blocks.ResidualInner(
+        filters=c // 2, strides=1, batch_norm_first=True)
+    test_layer = nn_blocks.ReversibleLayer(f, g)
+    test_layer(input_tensor, training=False)  # init weights
+    initial_weights = test_layer.get_weights()
+
+    with tf.keras.backend.learning_phase_scope(1):
+      # One forward pass updates the BN moving statistics exactly once.
+      test_layer(input_tensor)
+      expected_vars = tf.identity_n(test_layer.non_trainable_variables)
+
+      # The gradient pass must not add a second update on top of that.
+      test_layer.set_weights(initial_weights)
+      with tf.GradientTape() as tape:
+        output = test_layer(input_tensor)
+      tape.gradient(output, test_layer.trainable_variables)
+
+    for expected_var, var in zip(expected_vars,
+                                 test_layer.non_trainable_variables):
+      self.assertAllClose(expected_var, var)
+
 
 # Test class that wraps a standard attention layer. If this layer is called
 # at any point, the list passed to the config object will be filled with a
@@ -881,6 +1056,79 @@ class TransformerLayerTest(tf.test.TestCase, parameterized.TestCase):
     self.assertTrue(new_feedforward_call_list[0],
                     "The passed layer class wasn't instantiated.")
 
+  def test_transformer_scaffold_cache(self):
+    batch_size, sequence_length, width = 2, 4, 16
+    inputs = tf.random.normal([batch_size, sequence_length, width])
+    causal_mask = tf.linalg.band_part(
+        tf.ones([batch_size, sequence_length, sequence_length]), -1, 0)
+    test_layer = nn_blocks.TransformerScaffold(
+        attention_cls=nlp_modeling.layers.CachedAttention,
+        num_attention_heads=2,
+        inner_dim=32,
+        inner_activation='relu')
+    expected = test_layer([inputs, causal_mask])
+
+    cache = {
+        'key': tf.zeros([batch_size, 0, 2, width // 2]),
+        'value': tf.zeros([batch_size, 0, 2, width // 2]),
+    }
+    outputs = []
+    for step in range(sequence_length):
+      output, cache = test_layer(
+          [inputs[:, step:step + 1], causal_mask[:, step:step + 1, :step + 1]],
+          cache=cache)
+      outputs.append(output)
+
+    self.assertAllEqual([batch_size, sequence_length, 2, width // 2],
+                        cache['key'].shape.as_list())
+    self.assertAllClose(expected, tf.concat(outputs, axis=1),
+                        atol=1e-5, rtol=1e-5)
+
+  @parameterized.parameters(True, False)
+  def test_transformer_encoder_block_inference_chunks(self, norm_first):
+    inputs = tf.random.normal([2, 21, 16])
+    mask = tf.cast(tf.random.uniform([2, 21, 21]) > 0.2, tf.int32)
+    layer = nn_blocks.TransformerEncoderBlock(
+        num_attention_heads=2, inner_dim=32, inner_activation='relu',
+        norm_first=norm_first, return_attention_scores=True)
+    chunked_layer = nn_blocks.TransformerEncoderBlock(
+        num_attention_heads=2, inner_dim=32, inner_activation='relu',
+        norm_first=norm_first, return_attention_scores=True,
+        max_inference_chunk_size=8)
+    expected, expected_scores = layer([inputs, mask])
+    chunked_layer([inputs, mask])
+    chunked_layer.set_weights(layer.get_weights())
+
+    actual, actual_scores = chunked_layer([inputs, mask], training=False)
+
+    self.assertAllClose(expected, actual, atol=1e-5, rtol=1e-5)
+    self.assertAllClose(expected_scores, actual_scores, atol=1e-5, rtol=1e-5)
+
+  def test_transformer_encoder_block_cross_attention_output_range(self):
+    query = tf.random.normal([2, 21, 16])
+    key_value = tf.random.normal([2, 13, 16])
+    mask = tf.cast(tf.random.uniform([2, 21, 13]) > 0.2, tf.int32)
+    layer = nn_blocks.TransformerEncoderBlock(
+        num_attention_heads=2, inner_dim=32, inner_activation='relu',
+        norm_first=True)
+    expected = layer([query, key_value, mask])
+
+    actual = layer([query, key_value, mask], output_range=5)
+
+    self.assertAllClose(expected[:, :5], actual, atol=1e-5, rtol=1e-5)
+
+  def test_transformer_encoder_block_padding_mask(self):
+    inputs = tf.random.normal([2, 21, 16])
+    padding_mask = tf.sequence_mask([21, 13], 21, dtype=tf.int8)[:, None, :]
+    layer = nn_blocks.TransformerEncoderBlock(
+        num_attention_heads=2, inner_dim=32, inner_activation='relu',
+        max_inference_chunk_size=8)
+    expected = layer([inputs, tf.tile(padding_mask, [1, 21, 1])])
+
+    actual = layer([inputs, padding_mask])
+
+    self.assertAllClose(expected, actual, atol=1e-5, rtol=1e-5)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -14,6 +14,7 @@
 
 """Contains common building blocks for neural networks."""
 
+import math
 from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
 
 from absl import logging
@@ -196,10 +197,23 @@ class SqueezeExcitation(tf.keras.layers.Layer):
     base_config = super(SqueezeExcitation, self).get_config()
     return dict(list(base_config.items()) + list(config.items()))
 
-  def call(self, inputs):
+  def call(self, inputs, return_gate=False):
+    """Applies squeeze and excitation.
+
+    Args:
+      inputs: An input `tf.Tensor`.
+      return_gate: A `bool`. If True, return the per-channel gate of shape
+        `[batch, 1, 1, out_filters]` (or the 3D equivalent) instead of the
+        gated inputs, so callers can fold it into a following op.
+
+    Returns:
+      The gated inputs, or the gate if `return_gate` is True.
+    """
     x = tf.reduce_mean(inputs, self._spatial_axis, keepdims=True)
     x = self._activation_fn(self._se_reduce(x))
     x = self._gating_activation_fn(self._se_expand(x))
+    if return_gate:
+      return x
     return x * inputs
 
 
@@ -1291,7 +1305,12 @@ class MultiHeadAttention(tf.keras.layers.MultiHeadAttention):
   """
 
   def __init__(
-      self, *args, max_inference_parallelism: Optional[int] = None, **kwargs
+      self,
+      *args,
+      max_inference_parallelism: Optional[int] = None,
+      max_inference_query_chunk_size: Optional[int] = None,
+      num_kv_heads: Optional[int] = None,
+      **kwargs
   ):
     """Initializes MultiHeadAttention.
 
@@ -1300,18 +1319,67 @@ class MultiHeadAttention(tf.keras.layers.MultiHeadAttention):
       max_inference_parallelism: The number of examples to run in parallel
         during inference. Set this limit to reduce the peak memory usage. If
         None, use vectorized operations to run the whole batch in parallel.
+      max_inference_query_chunk_size: The number of query positions to attend
+        at once during inference. Long sequences are split into chunks of this
+        size along the query axis, so the attention logits and softmax
+        intermediates of only one chunk are live at a time. This also helps
+        when the batch is too small for `max_inference_parallelism` to matter.
+        If None, attend all query positions at once.
+      num_kv_heads: The number of key and value heads for grouped-query
+        attention. Each key and value head is shared by `num_heads //
+        num_kv_heads` consecutive query heads, which shrinks the key and value
+        projections and the memory they occupy. Set to 1 for multi-query
+        attention. If None, use one key and value head per query head.
       **kwargs: Keyword arguments passed to super().__init__.
     """
     super().__init__(*args, **kwargs)
     self._max_inference_parallelism = max_inference_parallelism
+    self._max_inference_query_chunk_size = max_inference_query_chunk_size
+    if num_kv_heads is not None and (
+        num_kv_heads <= 0 or self._num_heads % num_kv_heads
+    ):
+      raise ValueError(
+          '`num_heads` must be a multiple of `num_kv_heads`, got {} and {}.'
+          .format(self._num_heads, num_kv_heads)
+      )
+    self._num_kv_heads = num_kv_heads
 
   def get_config(self):
     config = super().get_config()
     config.update({
         'max_inference_parallelism': self._max_inference_parallelism,
+        'max_inference_query_chunk_size': (
+            self._max_inference_query_chunk_size
+        ),
+        'num_kv_heads': self._num_kv_heads,
     })
     return config
 
+  def _build_from_signature(self, query, value, key=None):
+    super()._build_from_signature(  # pytype: disable=attribute-error
+        query=query, value=value, key=key)
+    if self._num_kv_heads is None or self._num_kv_heads == self._num_heads:
+      return
+    if self._query_shape.rank != 3:
+      raise ValueError(
+          '`num_kv_heads` only supports queries of shape `(B, T, dim)`, got '
+          'rank {}.'.format(self._query_shape.rank)
+      )
+    # Rebuilds the key and value projections with `num_kv_heads` heads. The
+    # query and output projections are unchanged.
+    self._key_dense = self._make_kv_dense(self._key_dense)
+    self._value_dense = self._make_kv_dense(self._value_dense)
+
+  def _make_kv_dense(
+      self, dense: tf.keras.layers.EinsumDense
+  ) -> tf.keras.layers.EinsumDense:
+    """Returns a copy of `dense` that projects to `num_kv_heads` heads."""
+    config = dense.get_config()
+    output_shape = list(config['output_shape'])
+    output_shape[-2] = self._num_kv_heads
+    config['output_shape'] = output_shape
+    return tf.keras.layers.EinsumDense.from_config(config)
+
   def _compute_attention(
       self,
       query: tf.Tensor,
@@ -1338,9 +1406,12 @@ class MultiHeadAttention(tf.keras.layers.MultiHeadAttention):
     """
     batch_size = query.get_shape().as_list()[0]  # None if dynamic.
 
-    if (
-        training
-        or self._max_inference_parallelism is None
+    if training:
+      return self._compute_attention_delegate(
+          query, key, value, attention_mask, training
+      )
+    elif (
+        self._max_inference_parallelism is None
         or self._max_inference_parallelism <= 0
         or (
             # If the whole batch is allowed to be run in parallel, use fully
@@ -1350,18 +1421,22 @@ class MultiHeadAttention(tf.keras.layers.MultiHeadAttention):
             and batch_size <= self._max_inference_parallelism
         )
     ):
-      return self._compute_attention_delegate(
+      return self._compute_attention_in_query_chunks(
           query, key, value, attention_mask, training
       )
     else:
       # Sequentialize the inference execution with limited parallelism.
       def _compute_fn(x):
-        attention_output, attention_scores = self._compute_attention_delegate(
-            query=x[0][tf.newaxis, ...],
-            key=x[1][tf.newaxis, ...],
-            value=x[2][tf.newaxis, ...],
-            attention_mask=x[3][tf.newaxis, ...] if len(x) >= 4 else None,
-            training=training,
+        attention_output, attention_scores = (
+            self._compute_attention_in_query_chunks(
+                query=x[0][tf.newaxis, ...],
+                key=x[1][tf.newaxis, ...],
+                value=x[2][tf.newaxis, ...],
+                attention_mask=(
+                    x[3][tf.newaxis, ...] if len(x) >= 4 else None
+                ),
+                training=training,
+            )
         )
         attention_output = tf.squeeze(attention_output, axis=0)
         attention_scores = tf.squeeze(attention_scores, axis=0)
@@ -1379,6 +1454,52 @@ class MultiHeadAttention(tf.keras.layers.MultiHeadAttention):
           parallel_iterations=self._max_inference_parallelism,
       )
 
+  def _compute_attention_in_query_chunks(
+      self,
+      query: tf.Tensor,
+      key: tf.Tensor,
+      value: tf.Tensor,
+      attention_mask: Optional[tf.Tensor] = None,
+      training: Optional[bool] = None,
+  ):
+    """Applies attention to chunks of the query positions in sequence."""
+    query_length = query.get_shape().as_list()[1]  # None if dynamic.
+    chunk_size = self._max_inference_query_chunk_size
+    if (
+        chunk_size is None
+        or chunk_size <= 0
+        or query.shape.rank != 4
+        or query_length is None
+        or query_length <= chunk_size
+    ):
+      return self._compute_attention_delegate(
+          query, key, value, attention_mask, training
+      )
+
+    # A padding mask of shape `(B, 1, S)` broadcasts over the query axis and
+    # is shared by all chunks.
+    slice_mask = attention_mask is not None and attention_mask.shape[1] != 1
+    attention_outputs = []
+    attention_scores = []
+    for start in range(0, query_length, chunk_size):
+      end = start + chunk_size
+      attention_output, attention_score = self._compute_attention_delegate(
+          query=query[:, start:end],
+          key=key,
+          value=value,
+          attention_mask=(
+              attention_mask[:, start:end] if slice_mask else attention_mask
+          ),
+          training=training,
+      )
+      attention_outputs.append(attention_output)
+      attention_scores.append(attention_score)
+    # Scores are `(B, N, T, S)`, so the query axis is 2.
+    return (
+        tf.concat(attention_outputs, axis=1),
+        tf.concat(attention_scores, axis=2),
+    )
+
   def _compute_attention_delegate(
       self,
       query: tf.Tensor,
@@ -1388,8 +1509,70 @@ class MultiHeadAttention(tf.keras.layers.MultiHeadAttention):
       training: Optional[bool] = None,
   ):
     """Implements dot-product attention with query, key, value tensors."""
+    if self._num_kv_heads is not None and self._num_kv_heads != self._num_heads:
+      return self._compute_grouped_query_attention(
+          query, key, value, attention_mask, training
+      )
     # Simply calls the implementation of the super class here, while the users
     # can override this function for customizing attention computation.
     return super()._compute_attention(
         query, key, value, attention_mask, training
     )
+
+  def _compute_grouped_query_attention(
+      self,
+      query: tf.Tensor,
+      key: tf.Tensor,
+      value: tf.Tensor,
+      attention_mask: Optional[tf.Tensor] = None,
+      training: Optional[bool] = None,
+  ):
+    """Implements dot-product attention with shared key and value heads.
+
+    The query heads are split into `num_kv_heads` groups that attend to the
+    same key and value head, so the keys and values are never replicated.
+
+    Args:
+      query: Projected query `Tensor` of shape `(B, T, N, key_dim)`.
+      key: Projected key `Tensor` of shape `(B, S, K, key_dim)`, where `K` is
+        `num_kv_heads`.
+      value: Projected value `Tensor` of shape `(B, S, K, value_dim)`.
+      attention_mask: a boolean mask of shape `(B, T, S)`.
+      training: Python boolean indicating whether the layer should behave in
+        training mode (adding dropout) or in inference mode (doing nothing).
+
+    Returns:
+      attention_output: Multi-headed outputs of attention computation.
+      attention_scores: Multi-headed attention weights of shape `(B, N, T, S)`.
+    """
+    num_groups = self._num_heads // self._num_kv_heads
+    batch_size = tf.shape(query)[0]
+    query_length = tf.shape(query)[1]
+    key_length = tf.shape(key)[1]
+
+    query = tf.multiply(query, 1.0 / math.sqrt(float(self._key_dim)))
+    # `query` = [B, T, K, G, key_dim]
+    query = tf.reshape(
+        query,
+        [batch_size, query_length, self._num_kv_heads, num_groups,
+         self._key_dim])
+    # `attention_scores` = [B, K, G, T, S]
+    attention_scores = tf.einsum('bskh,btkgh->bkgts', key, query)
+    attention_scores = tf.reshape(
+        attention_scores,
+        [batch_size, self._num_heads, query_length, key_length])
+    attention_scores = self._masked_softmax(attention_scores, attention_mask)
+    attention_scores_dropout = self._dropout_layer(
+        attention_scores, training=training)
+
+    attention_scores_dropout = tf.reshape(
+        attention_scores_dropout,
+        [batch_size, self._num_kv_heads, num_groups, query_length,
+         key_length])
+    # `attention_output` = [B, T, K, G, value_dim]
+    attention_output = tf.einsum(
+        'bkgts,bskh->btkgh', attention_scores_dropout, value)
+    attention_output = tf.reshape(
+        attention_output,
+        [batch_size, query_length, self._num_heads, self._value_dim])
+    return attention_output, attention_scores
@@ -16,6 +16,7 @@
 
 # Import libraries
 from absl.testing import parameterized
+import numpy as np
 import tensorflow as tf
 
 from official.vision.modeling.layers import nn_layers
@@ -427,6 +428,59 @@ class NNLayersTest(parameterized.TestCase, tf.test.TestCase):
     output = layer(query=query, value=value)
     self.assertEqual(output.shape.as_list(), [None, 40, 80])
 
+  @parameterized.parameters(40, 1)
+  def test_multi_head_attention_query_chunks(self, mask_query_length):
+    query = tf.random.normal([2, 40, 16])
+    value = tf.random.normal([2, 20, 16])
+    mask = tf.cast(
+        tf.random.uniform([2, mask_query_length, 20]) > 0.2, tf.int32)
+    layer = nn_layers.MultiHeadAttention(num_heads=2, key_dim=8)
+    chunked_layer = nn_layers.MultiHeadAttention(
+        num_heads=2, key_dim=8, max_inference_query_chunk_size=16)
+    expected, expected_scores = layer(
+        query=query, value=value, attention_mask=mask,
+        return_attention_scores=True)
+    chunked_layer(query=query, value=value)
+    chunked_layer.set_weights(layer.get_weights())
+
+    actual, actual_scores = chunked_layer(
+        query=query, value=value, attention_mask=mask,
+        return_attention_scores=True)
+
+    self.assertAllClose(expected, actual, atol=1e-5, rtol=1e-5)
+    self.assertAllClose(expected_scores, actual_scores, atol=1e-5, rtol=1e-5)
+
+  def test_multi_head_attention_grouped_kv_heads(self):
+    query = tf.random.normal([2, 40, 16])
+    value = tf.random.normal([2, 20, 16])
+    mask = tf.cast(tf.random.uniform([2, 40, 20]) > 0.2, tf.int32)
+    grouped_layer = nn_layers.MultiHeadAttention(
+        num_heads=4, key_dim=8, num_kv_heads=2)
+    layer = nn_layers.MultiHeadAttention(num_heads=4, key_dim=8)
+    actual, actual_scores = grouped_layer(
+        query=query, value=value, attention_mask=mask,
+        return_attention_scores=True)
+    layer(query=query, value=value)
+    # Replicates each key and value head for the 2 query heads sharing it.
+    for dense, grouped_dense in [
+        (layer._query_dense, grouped_layer._query_dense),
+        (layer._output_dense, grouped_layer._output_dense)]:
+      dense.set_weights(grouped_dense.get_weights())
+    for dense, grouped_dense in [
+        (layer._key_dense, grouped_layer._key_dense),
+        (layer._value_dense, grouped_layer._value_dense)]:
+      kernel, bias = grouped_dense.get_weights()
+      self.assertEqual(kernel.shape, (16, 2, 8))
+      dense.set_weights([np.repeat(kernel, 2, axis=1),
+                         np.repeat(bias, 2, axis=0)])
+
+    expected, expected_scores = layer(
+        query=query, value=value, attention_mask=mask,
+        return_attention_scores=True)
+
+    self.assertAllClose(expected, actual, atol=1e-5, rtol=1e-5)
+    self.assertAllClose(expected_scores, actual_scores, atol=1e-5, rtol=1e-5)
+
 
 if __name__ == '__main__':
   tf.test.main()